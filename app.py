@@ -125,11 +125,26 @@ def create_app() -> FastAPI:
         await db_handler.initialize()
         print("База данных готова к работе!")
         
-        # Инициализация VAD моделей
-        print("Инициализация VAD моделей...")
-        from vad_realtime.transcribation_utils import initialize_vad
-        await initialize_vad()
-        print("VAD модели готовы к работе!")
+        # Пул потоков для DSP и мониторинг блокировок event loop
+        from services.dsp_executor import dsp_executor, loop_lag_monitor
+        dsp_executor.start()
+        loop_lag_monitor.start()
+
+        # ASR бэкенд (для local - пул потоков и фоновая загрузка модели)
+        from services.asr import asr_backend
+        asr_backend.start()
+
+        # Пул заранее открытых realtime сессий
+        from services.realtime_pool import realtime_pool
+        realtime_pool.start()
+
+        # Инициализация VAD моделей (в режиме server_vad по умолчанию - лениво, при первой сессии с локальным VAD)
+        from vad_realtime.prod_config import VAD_INPUT_MODE
+        if VAD_INPUT_MODE != 'server_vad':
+            print("Инициализация VAD моделей...")
+            from vad_realtime.transcribation_utils import initialize_vad
+            await initialize_vad()
+            print("VAD модели готовы к работе!")
         
         # Запуск фоновой задачи очистки неактивных соединений
         import asyncio
@@ -153,7 +168,27 @@ def create_app() -> FastAPI:
         cron_scheduler.setup_jobs()
         cron_scheduler.start()
         print("Планировщик кронтабов запущен!")
-    
+
+    # Освобождение фоновых ресурсов при остановке
+    @app.on_event("shutdown")
+    async def shutdown_event():
+        from services.cron_scheduler import cron_scheduler
+        cron_scheduler.stop()
+
+        # Планировщик батчей VAD (модуль уже загружен роутером /ws)
+        from vad_realtime.transcribation_utils import vad_scheduler
+        await vad_scheduler.stop()
+
+        # Готовые realtime сессии и общий HTTP пул OpenAI
+        from services.realtime_pool import realtime_pool
+        from services.openai_clients import openai_clients
+        await realtime_pool.close()
+        await openai_clients.close()
+
+        from services.dsp_executor import dsp_executor
+        dsp_executor.shutdown()
+        print("Фоновые ресурсы освобождены!")
+
     # Подключение роутеров с префиксом
     app.include_router(api.router, prefix=f"{server_prefix}/api", tags=["API"])
     app.include_router(crm.router, prefix=f"{server_prefix}/crm", tags=["CRM"])
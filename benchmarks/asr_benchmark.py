@@ -0,0 +1,57 @@
+"""
+Офлайн сравнение ASR бэкендов: OpenAI против локального faster-whisper.
+
+Запуск из корня проекта:
+    python -m benchmarks.asr_benchmark a.wav b.wav ... [--backends openai,local] [--runs 3]
+
+WAV - моно PCM16 16 кГц (например, записи AUDIO_DEBUG_CAPTURE). Для openai нужен OPENAI_API_KEY.
+По каждому файлу: медианная задержка, real-time factor (задержка / длительность аудио) и текст.
+Настройки локального движка берутся из тех же ASR_LOCAL_* переменных, что и в сервисе.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+import wave
+
+from services.asr import create_asr_backend, LocalWhisperASR
+from services.wav import WavStream
+
+
+def read_pcm(path: str) -> bytes:
+    with wave.open(path, 'rb') as wf:
+        if wf.getframerate() != 16000 or wf.getnchannels() != 1 or wf.getsampwidth() != 2:
+            raise SystemExit(f"{path}: нужен WAV моно PCM16 16 кГц")
+        return wf.readframes(wf.getnframes())
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('wavs', nargs='+')
+    parser.add_argument('--backends', default='openai,local')
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args()
+
+    clips = [(path, read_pcm(path)) for path in args.wavs]
+    for name in args.backends.split(','):
+        backend = create_asr_backend(name)
+        if isinstance(backend, LocalWhisperASR):
+            started = time.perf_counter()
+            backend.start()
+            await asyncio.get_running_loop().run_in_executor(backend._executor, backend._load)
+            print(f"[{name}] загрузка модели {time.perf_counter() - started:.2f} с")
+
+        for path, pcm in clips:
+            duration = len(pcm) / 32000
+            latencies = []
+            text = ''
+            for _ in range(args.runs):
+                started = time.perf_counter()
+                text = await backend.transcribe(WavStream(pcm))
+                latencies.append(time.perf_counter() - started)
+            median = statistics.median(latencies)
+            print(f"[{name}] {path} ({duration:.1f} с): {median * 1000:.0f} мс, RTF {median / duration:.2f} | {text}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
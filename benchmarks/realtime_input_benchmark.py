@@ -0,0 +1,86 @@
+"""
+Сравнение задержки двух режимов ввода реплики в realtime модель (нужен OPENAI_API_KEY).
+
+Запуск из корня проекта:
+    python -m benchmarks.realtime_input_benchmark path/to/utterance.wav [--runs 5]
+
+WAV - моно PCM16 16 кГц (например, запись из AUDIO_DEBUG_CAPTURE).
+Меряется время от конца реплики до первого response.audio.delta:
+  whisper - whisper-1 транскрибация, затем conversation.item.create + response.create
+  audio   - input_audio_buffer.append + commit + response.create
+В рабочем сервисе те же величины пишутся в метрики turn_first_audio_seconds_{режим}.
+"""
+import argparse
+import asyncio
+import base64
+import statistics
+import time
+import wave
+
+from openai import AsyncOpenAI
+
+from services.resampler import resample
+from services.wav import WavStream
+from vad_realtime.prod_config import OPEN_AI_API_KEY
+
+MODEL = "gpt-4o-realtime-preview-2024-12-17"
+INSTRUCTIONS = "Отвечай одним коротким предложением."
+
+
+async def first_audio_delta(connection) -> None:
+    async for event in connection:
+        if event.type == "response.audio.delta":
+            return
+        if event.type == "error":
+            raise RuntimeError(event.error)
+
+
+async def run_once(client: AsyncOpenAI, pcm16k: bytes, mode: str) -> float:
+    async with client.beta.realtime.connect(model=MODEL) as connection:
+        await connection.session.update(session={
+            "modalities": ["text", "audio"],
+            "instructions": INSTRUCTIONS,
+            "input_audio_transcription": {"model": "whisper-1"} if mode == 'audio' else None,
+            "turn_detection": None,
+        })
+
+        started = time.perf_counter()
+        if mode == 'audio':
+            pcm24k = resample(pcm16k, 16000, 24000)
+            for offset in range(0, len(pcm24k), 48000):
+                await connection.input_audio_buffer.append(
+                    audio=base64.b64encode(pcm24k[offset:offset + 48000]).decode()
+                )
+            await connection.input_audio_buffer.commit()
+        else:
+            transcript = await client.audio.transcriptions.create(model="whisper-1", file=WavStream(pcm16k))
+            await connection.conversation.item.create(item={
+                "type": "message", "role": "user",
+                "content": [{"type": "input_text", "text": transcript.text}],
+            })
+        await connection.response.create()
+        await first_audio_delta(connection)
+        return time.perf_counter() - started
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('wav')
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    with wave.open(args.wav, 'rb') as wf:
+        if wf.getframerate() != 16000 or wf.getnchannels() != 1 or wf.getsampwidth() != 2:
+            raise SystemExit("Нужен WAV моно PCM16 16 кГц")
+        pcm16k = wf.readframes(wf.getnframes())
+
+    client = AsyncOpenAI(api_key=OPEN_AI_API_KEY)
+    print(f"Реплика {len(pcm16k) / 32000:.2f} с, прогонов {args.runs}\n")
+    for mode in ('whisper', 'audio'):
+        latencies = [await run_once(client, pcm16k, mode) for _ in range(args.runs)]
+        print(f"{mode:<8} до первого аудио: медиана {statistics.median(latencies) * 1000:.0f} мс, "
+              f"мин {min(latencies) * 1000:.0f} мс, макс {max(latencies) * 1000:.0f} мс")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
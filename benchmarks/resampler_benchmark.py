@@ -0,0 +1,96 @@
+"""
+Бенчмарк ресемплера 44.1 кГц -> 16 кГц: прежний np.interp против полифазного фильтра.
+
+Запуск из корня проекта:
+    python -m benchmarks.resampler_benchmark
+
+Меряет время на чанк, аллокации не считает. Качество оценивается по алиасингу:
+тон выше 8 кГц должен быть подавлен, а не отражен в полосу 0-8 кГц.
+"""
+import time
+
+import numpy as np
+
+from services.resampler import StreamResampler, resample
+
+ORIG_SR = 44100
+TARGET_SR = 16000
+CHUNK_SAMPLES = 4096  # Типичный размер чанка от клиента
+ITERATIONS = 2000
+
+
+def interp_resample(audio, orig_sr, target_sr):
+    """Прежняя реализация (np.interp по новой сетке на каждый чанк)"""
+    audio_data = np.frombuffer(audio, dtype=np.int16)
+    resampled_data = np.interp(
+        np.linspace(0, len(audio_data), int(len(audio_data) * target_sr / orig_sr)),
+        np.arange(len(audio_data)),
+        audio_data
+    )
+    return np.int16(resampled_data).tobytes()
+
+
+def tone(freq, seconds=1.0, amplitude=8000):
+    t = np.arange(int(ORIG_SR * seconds)) / ORIG_SR
+    return (amplitude * np.sin(2 * np.pi * freq * t)).astype(np.int16)
+
+
+def bench(name, func):
+    started = time.perf_counter()
+    for _ in range(ITERATIONS):
+        func()
+    per_chunk = (time.perf_counter() - started) / ITERATIONS * 1e6
+    realtime = CHUNK_SAMPLES / ORIG_SR * 1e6 / per_chunk
+    print(f"{name:<28} {per_chunk:9.1f} мкс/чанк   x{realtime:,.0f} быстрее реального времени")
+
+
+def rms(audio_bytes):
+    samples = np.frombuffer(audio_bytes, dtype=np.int16).astype(np.float64)
+    return np.sqrt(np.mean(samples[200:-200] ** 2))
+
+
+def seam_error(func_chunked, func_whole, signal):
+    """Максимальное расхождение между обработкой по чанкам и целиком"""
+    chunked = np.concatenate([
+        np.frombuffer(func_chunked(signal[i:i + CHUNK_SAMPLES]), dtype=np.int16)
+        for i in range(0, len(signal), CHUNK_SAMPLES)
+    ]).astype(np.int32)
+    whole = np.frombuffer(func_whole(signal), dtype=np.int16).astype(np.int32)
+    n = min(len(chunked), len(whole))
+    return int(np.abs(chunked[:n] - whole[:n]).max())
+
+
+def main():
+    chunk = tone(440)[:CHUNK_SAMPLES]
+    chunk_bytes = chunk.tobytes()
+
+    print(f"Скорость, чанк {CHUNK_SAMPLES} сэмплов ({CHUNK_SAMPLES / ORIG_SR * 1000:.0f} мс):")
+    bench("np.interp (прежний)", lambda: interp_resample(chunk_bytes, ORIG_SR, TARGET_SR))
+    stream = StreamResampler(ORIG_SR, TARGET_SR)
+    bench("полифазный, потоковый", lambda: stream.process_bytes(chunk_bytes))
+
+    print("\nАлиасинг: RMS на выходе для тона выше 8 кГц (исходная RMS ~5657):")
+    for freq in (10000, 12000, 15000, 20000):
+        signal = tone(freq).tobytes()
+        old = rms(interp_resample(signal, ORIG_SR, TARGET_SR))
+        new = rms(resample(signal, ORIG_SR, TARGET_SR))
+        print(f"  {freq:>5} Гц   np.interp={old:8.1f}   полифазный={new:8.2f}")
+
+    print("\nШвы на границах чанков (макс. расхождение чанки/целиком, в отсчетах int16):")
+    signal = tone(440, seconds=2)
+    old = seam_error(
+        lambda part: interp_resample(part.tobytes(), ORIG_SR, TARGET_SR),
+        lambda whole: interp_resample(whole.tobytes(), ORIG_SR, TARGET_SR),
+        signal,
+    )
+    chunked_stream = StreamResampler(ORIG_SR, TARGET_SR)
+    new = seam_error(
+        lambda part: chunked_stream.process(part).tobytes(),
+        lambda whole: StreamResampler(ORIG_SR, TARGET_SR).process(whole).tobytes(),
+        signal,
+    )
+    print(f"  np.interp={old}   полифазный={new}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Бенчмарк бэкендов Silero VAD: torch (JIT) против ONNX Runtime.
+
+Запуск из корня проекта:
+    python -m benchmarks.vad_backends_benchmark
+    python -m benchmarks.vad_backends_benchmark --smoke   # только проверка: одно окно и батч из двух сессий на бэкенд
+
+Каждый бэкенд меряется в отдельном процессе, чтобы RSS не смешивался:
+время загрузки пула, прирост памяти, задержка одного окна и пропускная способность
+батчевого инференса (infer_batch, как в рабочем планировщике).
+"""
+import argparse
+import json
+import subprocess
+import sys
+import time
+
+POOL_SIZE = 4
+LATENCY_CALLS = 2000
+THROUGHPUT_SECONDS = 3.0
+BATCH_SIZES = (1, 16, 64)
+WINDOWS_PER_REQUEST = 8
+
+
+def rss_mb() -> float:
+    """Текущий RSS процесса (Linux)"""
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def smoke(onnx_threads: int):
+    """
+    Одно окно 512 сэмплов через каждый бэкенд (и через копию модели из пула),
+    затем батч из двух сессий против отдельных прогонов
+    """
+    import torch
+    from vad_realtime.vad_backends import load_vad_models, BACKENDS
+    from vad_realtime.vad_scheduler import check_batched_inference
+
+    for backend in BACKENDS:
+        models = load_vad_models(backend, 2, onnx_threads)
+        probs = [float(model(torch.zeros(512), 16000)) for model in models]
+        for model in models:
+            check_batched_inference(model)
+        print(f"{backend}: ok | prob={probs} | batched=ok")
+
+
+def run_backend(backend: str, onnx_threads: int) -> dict:
+    import numpy as np
+    import torch
+    from vad_realtime.vad_backends import load_vad_models
+    from vad_realtime.vad_scheduler import infer_batch, VADState, WINDOW_SIZE
+
+    torch.set_num_threads(1)
+    baseline = rss_mb()
+    started = time.perf_counter()
+    models = load_vad_models(backend, POOL_SIZE, onnx_threads)
+    load_seconds = time.perf_counter() - started
+    model = models[0]
+
+    rng = np.random.default_rng(0)
+
+    def request(n_windows):
+        windows = rng.integers(-3000, 3000, size=(n_windows, WINDOW_SIZE), dtype=np.int16)
+        return windows, VADState()
+
+    # Задержка: одна сессия, одно окно
+    single = request(1)
+    for _ in range(50):
+        infer_batch(model, [single])
+    latencies = []
+    for _ in range(LATENCY_CALLS):
+        t0 = time.perf_counter()
+        infer_batch(model, [single])
+        latencies.append(time.perf_counter() - t0)
+    latencies.sort()
+
+    # Пропускная способность: окон в секунду при разном размере батча
+    throughput = {}
+    for batch_size in BATCH_SIZES:
+        batch = [request(WINDOWS_PER_REQUEST) for _ in range(batch_size)]
+        windows = 0
+        t0 = time.perf_counter()
+        while time.perf_counter() - t0 < THROUGHPUT_SECONDS:
+            infer_batch(model, batch)
+            windows += batch_size * WINDOWS_PER_REQUEST
+        throughput[batch_size] = windows / (time.perf_counter() - t0)
+
+    return {
+        'backend': backend,
+        'load_seconds': load_seconds,
+        'rss_delta_mb': rss_mb() - baseline,
+        'latency_p50_us': latencies[len(latencies) // 2] * 1e6,
+        'latency_p99_us': latencies[int(len(latencies) * 0.99)] * 1e6,
+        'throughput': throughput,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--backend', choices=('torch', 'onnx'))
+    parser.add_argument('--onnx-threads', type=int, default=1)
+    parser.add_argument('--smoke', action='store_true')
+    args = parser.parse_args()
+
+    if args.smoke:
+        smoke(args.onnx_threads)
+        return
+
+    if args.backend:
+        print(json.dumps(run_backend(args.backend, args.onnx_threads)))
+        return
+
+    results = []
+    for backend in ('torch', 'onnx'):
+        output = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.vad_backends_benchmark', '--backend', backend,
+             '--onnx-threads', str(args.onnx_threads)],
+            capture_output=True, text=True, check=True,
+        ).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    print(f"Пул из {POOL_SIZE} моделей, окно 512 сэмплов (32 мс)\n")
+    print(f"{'':<8}{'загрузка, с':>12}{'RSS, МБ':>10}{'p50, мкс':>10}{'p99, мкс':>10}"
+          + ''.join(f"{f'окон/с b={b}':>16}" for b in BATCH_SIZES))
+    for r in results:
+        print(f"{r['backend']:<8}{r['load_seconds']:>12.2f}{r['rss_delta_mb']:>10.1f}"
+              f"{r['latency_p50_us']:>10.0f}{r['latency_p99_us']:>10.0f}"
+              + ''.join(f"{r['throughput'][str(b)]:>16,.0f}" for b in BATCH_SIZES))  # Ключи после JSON - строки
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 import asyncio
+import functools
 import time
 import io
 from fastapi import WebSocket
@@ -6,6 +7,8 @@ from datetime import datetime
 
 from .prod_config import INSTRUCTIONS_4
 from .llm_utils import AsyncOpenAIAgent
+from services.playback import PlaybackScheduler
+from services.audio_framing import OUTBOUND_FRAMING, OUTBOUND_CODEC
 
 import logging
 import sys
@@ -34,6 +37,7 @@ class ConnectionManager:
                 'queue': audio_queue, # Очередь синтеза аудио
                 'chat_history': [], # История разговора
                 'play': play_queue, # Очередь отправки аудио
+                'playback': PlaybackScheduler(functools.partial(self.send_bytes, client_ip), name=client_ip), # Темп отправки аудио клиенту
                 'socket': websocket, # Вебсокет, по которому происходит связь с клиентом
                 'audio_buffer': io.BytesIO(), # Аудиобуфер, в который копятся чанки перед отправкой на транскрибацию
                 'temporary_buffer': [], # Аудиобуфер с чанками, в который начинают писаться аудио в случае обнаружения голоса
@@ -252,7 +256,10 @@ async def apply_settings(connection_manager, client_ip):
         instruction += '\n\n## Длина ответа: Старайся делать ответ более длинным.'
     # Для 'normal' ничего не добавляем
     
-    agent = AsyncOpenAIAgent(instruction, connection_manager, client_ip, "gpt-4o-realtime-preview-2024-12-17", voice)
+    output_framing = await connection_manager.get_property(client_ip, 'output_framing') or OUTBOUND_FRAMING
+    output_codec = await connection_manager.get_property(client_ip, 'output_codec') or OUTBOUND_CODEC
+    agent = AsyncOpenAIAgent(instruction, connection_manager, client_ip, "gpt-4o-realtime-preview-2024-12-17", voice,
+                             output_framing=output_framing, output_codec=output_codec)
     await agent.connect()
     await connection_manager.set_property(client_ip, 'agent', agent)
     await connection_manager.send_text(client_ip,'Настройки применены. Ассистент инициализирован.')
@@ -1,16 +1,18 @@
 import asyncio
 from typing_extensions import override
-from openai import AsyncAssistantEventHandler, AsyncOpenAI
+from openai import AsyncAssistantEventHandler
 import re
 import time
 import logging
 import base64
 import sys
-import io
-import wave
 
 from .prod_config import OPEN_AI_API_KEY
 from services.token_logger import token_logger
+from services.openai_clients import get_openai_client
+from services.realtime_pool import realtime_pool
+from services.realtime_context import RealtimeContext
+from services.audio_framing import OutboundAudioFramer, OUTBOUND_FRAMING, OUTBOUND_CODEC
 
 logging.basicConfig(
     level=logging.INFO,
@@ -20,10 +22,11 @@ logging.basicConfig(
 logger = logging.getLogger("uvicorn")
 
 class AsyncOpenAIAgent:
-    def __init__(self, instructions, connection_manager, client_ip, model, voice):
+    def __init__(self, instructions, connection_manager, client_ip, model, voice,
+                 output_framing=OUTBOUND_FRAMING, output_codec=OUTBOUND_CODEC):
         """ Initialize voice assistant. """
 
-        self.client = AsyncOpenAI(api_key=OPEN_AI_API_KEY)
+        self.client = get_openai_client(OPEN_AI_API_KEY)
         self.instructions = instructions
         self.handler = connection_manager
         self.client_ip = client_ip
@@ -32,16 +35,16 @@ class AsyncOpenAIAgent:
         self.connection = None
         self._is_running = False
         self._generating = False
+        self.audio_framer = OutboundAudioFramer(output_framing, codec=output_codec)  # Пакеты исходящего аудио
+        self.context = RealtimeContext()  # Элементы разговора сессии и бюджет токенов контекста
 
     async def connect(self):
         """Start the assistant and establish connection."""
         if self._is_running:
             return
-        self.connection = await self.client.beta.realtime.connect(
-            model=self.model
-        ).enter()
-
-        await self.connection.session.update(
+        # Готовое соединение из пула (или новое, если пул пуст) сразу с настройками сессии
+        self.connection = await realtime_pool.open(
+            self.model,
             session={
                 "modalities": ["text", "audio"],
                 "instructions": self.instructions,
@@ -59,6 +62,7 @@ class AsyncOpenAIAgent:
         if not self._is_running:
             return
         self._is_running = False
+        self.context.close()
 
         if self.connection:
             await self.connection.close()
@@ -70,9 +74,14 @@ class AsyncOpenAIAgent:
                 if self._generating == True:
                     await self.connection.response.cancel()
                 self._generating = False
+                self.audio_framer.reset()
             except Exception as e:
                 logger.error(f"[MY_LOG] AOAIAgent_cancel: {e}")
 
+    def _playback(self):
+        connection = self.handler.connections.get(self.client_ip)
+        return connection.get('playback') if connection else None
+
     async def send_text(self, text):
         if self._is_running and self.connection:
             if self._generating:
@@ -99,22 +108,37 @@ class AsyncOpenAIAgent:
             await self._handle_message(self.message, play_queue)
             # await asyncio.sleep(0.05)
 
+    async def _queue_audio(self, packets, play_queue):
+        """Ставит пакеты в очередь отправки и копит длительность синтезированного ответа для отчета"""
+        # Поколение - до кодирования: перебивание во время encode отбросит эти пакеты
+        playback = self._playback()
+        generation = playback.generation if playback else None
+        packets = await self.audio_framer.encode(packets)
+        for data, duration in packets:
+            await play_queue.put((data, duration, generation))
+        duration = sum(packet[1] for packet in packets)
+        if not duration:
+            return
+        try:
+            current = await self.handler.get_property(self.client_ip, 'bot_audio_duration')
+            current = current or 0
+            await self.handler.set_property(self.client_ip, 'bot_audio_duration', current + duration)
+        except Exception:
+            pass
+
     async def _handle_message(self, message, play_queue):
         """Внутренний обработчик сообщений"""
         logger.info(f"[MY_LOG] AOAIAgent_h_m: {message.type}")
+        self.context.on_event(message)
 
         if message.type == "response.audio.delta":
             self._generating = True
-            audio = base64.b64decode(message.delta)
-            (response_audio, duration) = await process_audio(audio)
-            await play_queue.put((response_audio, duration))
-            # Копим длительность синтезированного ответа для отчета
-            try:
-                current = await self.handler.get_property(self.client_ip, 'bot_audio_duration')
-                current = current or 0
-                await self.handler.set_property(self.client_ip, 'bot_audio_duration', current + (duration or 0))
-            except Exception:
-                pass
+            packets = self.audio_framer.push(base64.b64decode(message.delta))
+            await self._queue_audio(packets, play_queue)
+
+        elif message.type == "response.audio.done":
+            # Хвост ответа короче пакета
+            await self._queue_audio(self.audio_framer.flush(), play_queue)
 
         elif message.type == "response.audio_transcript.done":
             # await self.handler.add_assistant_message(self.client_ip, message.transcript)
@@ -129,6 +153,7 @@ class AsyncOpenAIAgent:
             logger.info(f"[MY_LOG] AOAIAgent_h_m: {message}")
         elif message.type == 'response.done':
             self._generating = False
+            self.audio_framer.reset()
             
             # Логируем использованные токены
             try:
@@ -155,6 +180,10 @@ class AsyncOpenAIAgent:
                         )
             except Exception as e:
                 logger.error(f"Ошибка логирования токенов: {e}")
+
+            # Контекст сверх бюджета: старые реплики удаляются или сворачиваются в сводку (в фоне)
+            if self.context.on_response_done(getattr(message, 'response', None)):
+                self.context.schedule_prune(self.connection)
             
             # Фиксируем конец ответа и считаем длительность
             response_start = await self.handler.get_property(self.client_ip, 'response_start_time')
@@ -169,23 +198,6 @@ class AsyncOpenAIAgent:
             logger.error(f"[MY_LOG] AOAIAgent_h_m: {message}")
 
 
-async def process_audio(response_audio):
-    """Обрабатывает аудиобайты, выполняет ресемплинг при необходимости."""
-    buffer = io.BytesIO()
-    with wave.open(buffer, 'wb') as wf:
-        wf.setnchannels(1)
-        wf.setsampwidth(2)
-
-        num_samples = len(response_audio[200:]) // 2
-        wf.setframerate(24000)
-        duration = num_samples / 24000
-
-        wf.writeframes(response_audio[200:])
-
-    buffer.seek(0)
-    return buffer.read(), duration
-
-
 async def cancel_and_start_llm_generation(connection_manager, client_ip, query):
     await connection_manager.cancel_llm_task(client_ip)
     task = asyncio.create_task(start_llm_generation(connection_manager, client_ip, query))
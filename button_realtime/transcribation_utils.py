@@ -1,9 +1,7 @@
+import io
 import time
-import openai
 
-from .prod_config import OPEN_AI_API_KEY
-
-client = openai.AsyncOpenAI(api_key=OPEN_AI_API_KEY)
+from services.asr import transcribe_audio
 
 async def save_and_process_audio(connection_manager, client_ip: str, filename):
     """Сохраняет и обрабатывает аудиофайл"""
@@ -23,8 +21,20 @@ async def save_and_process_audio(connection_manager, client_ip: str, filename):
             return
     
     start_time = time.time()
+    # Реплика записана: от этого момента считается задержка до первого байта ответа
+    playback = await connection_manager.get_property(client_ip, 'playback')
+    if playback:
+        playback.mark_turn_start()
     with open(filename, 'rb') as f:
-        transcribed_text = await audio_to_text(f)
+        audio_bytes = f.read()
+
+    async def make_audio():
+        # Для каждого запроса (основного и хеджа) - свой поток чтения
+        audio = io.BytesIO(audio_bytes)
+        audio.name = 'audio.wav'
+        return audio
+
+    transcribed_text = await transcribe_audio(make_audio)
 
     # transcribed_text = await transcribate_file_rt(filename, False)
 
@@ -45,12 +55,3 @@ async def save_and_process_audio(connection_manager, client_ip: str, filename):
         
         agent = await connection_manager.get_property(client_ip, 'agent')
         await agent.send_text(transcribed_text)
-
-
-async def audio_to_text(audio_stream):
-
-    transcript = await client.audio.transcriptions.create(
-        model="whisper-1",
-        file=audio_stream,
-    )
-    return transcript.text
\ No newline at end of file
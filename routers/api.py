@@ -6,6 +6,8 @@ from services.payment_service import payment_service
 from services import payment_manager
 from services.language_cache import language_cache, exchange_rate_cache
 from services.report_generator import report_generator
+from services.metrics import metrics
+from services.openai_clients import openai_clients
 from services.config_parser import get_config_parser, get_tariffs_parser
 import jwt
 import os
@@ -1812,6 +1814,35 @@ async def generate_token_report(password: str):
         )
 
 
+# ========================================
+# Секретный роут метрик аудио-пайплайна
+# ========================================
+@router.get("/secret/metrics")
+async def get_metrics(password: str):
+    """
+    Снимок метрик процесса (VAD, транскрибация, realtime сессии)
+
+    Параметры:
+        - password: Пароль для доступа (тот же, что и для отчетов)
+    """
+    expected_password = os.getenv("REPORT_PASSWORD", "")
+
+    if not expected_password:
+        raise HTTPException(
+            status_code=500,
+            detail="Report password not configured"
+        )
+
+    if password != expected_password:
+        raise HTTPException(
+            status_code=403,
+            detail="Invalid password"
+        )
+
+    # Пул соединений к OpenAI меняется и без запросов (простаивающие соединения закрываются)
+    openai_clients.publish()
+    return metrics.snapshot()
+
 # CRM роуты (будут перенесены в отдельный файл)
 
 
@@ -7,7 +7,16 @@ import time
 # Импортируем компоненты из vad_realtime (серверная версия)
 from vad_realtime.connection_handlers import ConnectionManager as VADConnectionManager, apply_settings as vad_apply_settings
 from vad_realtime.transcribation_utils import process_audio_chunk
-from vad_realtime.other_utils import resample
+from vad_realtime.ingest_queue import IngestQueue
+from vad_realtime.llm_utils import INPUT_MODES, INPUT_MODE_SERVER_VAD, REALTIME_SAMPLE_RATE
+from vad_realtime.prod_config import (
+    VAD_INPUT_MODE, INGEST_QUEUE_MAX_FRAMES, INGEST_QUEUE_MAX_MS, INGEST_COALESCE_MS, INGEST_OVERLOAD_POLICY,
+)
+from services.dsp_executor import dsp_executor
+from services.resampler import StreamResampler
+from services.opus_codec import opus_available, create_decoder, opus_batch_decoder
+from services.metrics import metrics
+from services.audio_framing import describe_format, FRAMINGS, OUTBOUND_FRAMING, OUTBOUND_CODEC, CODECS, CODEC_OPUS
 
 # Импортируем компоненты из button_realtime
 from button_realtime.connection_handlers import ConnectionManager as ButtonConnectionManager, apply_settings as button_apply_settings
@@ -27,6 +36,55 @@ router = APIRouter()
 vad_connection_manager = VADConnectionManager()
 button_connection_manager = ButtonConnectionManager()
 
+# Форматы входящего аудио для /ws
+VAD_SAMPLE_RATE = 16000  # Частота, на которой работают VAD и транскрибация
+SUPPORTED_SAMPLE_RATES = [16000, 24000, 44100, 48000]
+DEFAULT_SAMPLE_RATE = 44100
+DEFAULT_CODEC = 'pcm16'
+OPUS_BYTES_PER_MS = 8  # Оценка сверху для Opus (~64 кбит/с) при расчете лимитов очереди
+
+def supported_audio_formats() -> list:
+    """Форматы входящего аудио, которые сервер умеет принимать"""
+    formats = [{'codec': 'pcm16', 'sample_rates': SUPPORTED_SAMPLE_RATES}]
+    if opus_available():
+        # Один Opus пакет на одно бинарное сообщение. Частота кодирования клиента не важна:
+        # декодер сервера сразу выдает PCM в рабочей частоте, поэтому список частот не предлагается
+        formats.append({'codec': 'opus', 'framing': 'packet_per_message'})
+    return formats
+
+def negotiate_audio_format(query_params) -> dict:
+    """Выбирает формат по query параметрам sample_rate и codec, с откатом на 44.1 кГц PCM"""
+    codec = query_params.get('codec', DEFAULT_CODEC).lower()
+    try:
+        sample_rate = int(query_params.get('sample_rate', DEFAULT_SAMPLE_RATE))
+    except ValueError:
+        sample_rate = DEFAULT_SAMPLE_RATE
+
+    if codec == 'opus' and not opus_available():
+        logger.warning('[VAD WS] Клиент запросил Opus, но opuslib недоступен | откат на pcm16')
+        codec = DEFAULT_CODEC
+        sample_rate = DEFAULT_SAMPLE_RATE
+    elif codec not in ('pcm16', 'opus'):
+        codec = DEFAULT_CODEC
+
+    if codec == 'pcm16' and sample_rate not in SUPPORTED_SAMPLE_RATES:
+        sample_rate = DEFAULT_SAMPLE_RATE
+    return {'codec': codec, 'sample_rate': sample_rate}
+
+def negotiate_output_format(query_params) -> tuple[str, str]:
+    """Кодек и упаковка исходящего аудио по query параметрам output_codec и output_framing"""
+    codec = query_params.get('output_codec', OUTBOUND_CODEC).lower()
+    if codec not in CODECS:
+        codec = OUTBOUND_CODEC
+    if codec == CODEC_OPUS and not opus_available():
+        logger.warning('[WS] Запрошен исходящий Opus, но opuslib недоступен | откат на pcm16')
+        codec = 'pcm16'
+    # wav (заголовок на пакет) | stream (один заголовок на ответ); для opus не используется
+    framing = query_params.get('output_framing', OUTBOUND_FRAMING).lower()
+    if framing not in FRAMINGS:
+        framing = OUTBOUND_FRAMING
+    return codec, framing
+
 async def get_user_id_from_cookies(websocket: WebSocket) -> tuple[str, bool]:
     """Извлекает user_id из JWT токена в куки WebSocket запроса
     
@@ -94,6 +152,14 @@ async def websocket_endpoint(websocket: WebSocket):
     voice = query_params.get('voice', 'alloy').lower()  # Приводим к нижнему регистру
     topic = query_params.get('topic', None)
     response_length = query_params.get('response_length', 'normal').lower()
+    # Формат входящего аудио (sample_rate, codec)
+    audio_format = negotiate_audio_format(query_params)
+    # Режим ввода: локальный VAD (whisper | audio) или серверный детектор речи (server_vad)
+    input_mode = query_params.get('input_mode', VAD_INPUT_MODE).lower()
+    if input_mode not in INPUT_MODES:
+        input_mode = VAD_INPUT_MODE
+    # Формат исходящего аудио (output_codec, output_framing)
+    output_codec, output_framing = negotiate_output_format(query_params)
     
     # Валидация голоса
     valid_voices = ['alloy', 'ash', 'ballad', 'coral', 'echo', 'sage', 'shimmer', 'verse', 'marin', 'cedar']
@@ -109,6 +175,9 @@ async def websocket_endpoint(websocket: WebSocket):
         await vad_connection_manager.set_property(session_id,'topic', topic)
     await vad_connection_manager.set_property(session_id, 'voice', voice)
     await vad_connection_manager.set_property(session_id, 'response_length', response_length)
+    await vad_connection_manager.set_property(session_id, 'input_mode', input_mode)
+    await vad_connection_manager.set_property(session_id, 'output_framing', output_framing)
+    await vad_connection_manager.set_property(session_id, 'output_codec', output_codec)
     
     # Сохраняем информацию о пользователе
     await vad_connection_manager.set_property(session_id, 'user_id', user_id)
@@ -125,11 +194,31 @@ async def websocket_endpoint(websocket: WebSocket):
             await vad_connection_manager.disconnect(session_id)
             return
 
-    logger.info(f'[VAD WS] ✓ Подключен | user_id={user_id} | authenticated={is_authenticated} | session={session_id} | активных={len(vad_connection_manager.connections)}')
+    logger.info(f'[VAD WS] ✓ Подключен | user_id={user_id} | authenticated={is_authenticated} | session={session_id} | audio={audio_format["codec"]}/{audio_format["sample_rate"]} | input={input_mode} | активных={len(vad_connection_manager.connections)}')
+    # Фронтенд ждет строку CONNECTED:{id} как есть; форматы аудио - отдельным JSON сообщением
+    await vad_connection_manager.send_text(session_id, f'CONNECTED:{session_id}')
+    await vad_connection_manager.send_text(session_id, {
+        'type': 'audio_format',
+        'audio_format': audio_format,
+        'supported_audio_formats': supported_audio_formats(),
+        'input_mode': input_mode,
+        'output_audio_format': describe_format(output_codec, output_framing),
+    })
     await vad_connection_manager.send_text(session_id, 'Успешно подключено')
 
     await vad_apply_settings(vad_connection_manager, session_id)
 
+    # Очередь входящих кадров: чтение сокета не ждет VAD, обработка забирает кадры пачкой
+    codec = audio_format['codec']
+    bytes_per_ms = audio_format['sample_rate'] * 2 / 1000 if codec == 'pcm16' else OPUS_BYTES_PER_MS
+    ingest_queue = IngestQueue(
+        max_frames=INGEST_QUEUE_MAX_FRAMES,
+        max_bytes=int(INGEST_QUEUE_MAX_MS * bytes_per_ms),
+        coalesce_bytes=int(INGEST_COALESCE_MS * bytes_per_ms),
+        policy=INGEST_OVERLOAD_POLICY,
+        mergeable=codec == 'pcm16',
+    )
+
     async def receive_chunk():
         """
         Цикл для получения аудио-чанков от пользователя
@@ -154,21 +243,56 @@ async def websocket_endpoint(websocket: WebSocket):
                     await vad_connection_manager.update_activity(session_id)
                     
                     data = message["bytes"]
-                    frame = resample(data, 44100, 16000)
-                    frame = frame[300:]
-                    
-                    # Убеждаемся, что размер кратен 2 для int16
-                    if len(frame) % 2 != 0:
-                        frame = frame[:-1]
-
-                    await process_audio_chunk(vad_connection_manager, session_id, frame)
-
-                await asyncio.sleep(0.05)
+                    metrics.inc(f'ws_ingest_bytes_{codec}_total', len(data))
+                    ingest_queue.put_nowait(data)
 
             except asyncio.TimeoutError:
                 logger.warning(f"[VAD WS] Таймаут | session={session_id} | нет данных {RECEIVE_TIMEOUT} сек")
                 break
 
+    async def process_ingest():
+        """
+        Цикл обработки входящих кадров: декодирование/ресемплинг и VAD
+        (в режиме server_vad - сразу в realtime сессию, локальные VAD и Whisper не участвуют)
+        """
+        server_vad = input_mode == INPUT_MODE_SERVER_VAD
+        target_rate = REALTIME_SAMPLE_RATE if server_vad else VAD_SAMPLE_RATE
+        agent = await vad_connection_manager.get_property(session_id, 'agent') if server_vad else None
+        decoder = None
+        resampler = None
+        if codec == 'opus':
+            # Opus декодируется сразу в целевую частоту, ресемплинг не нужен
+            decoder = create_decoder(target_rate)
+        elif audio_format['sample_rate'] != target_rate:
+            # Ресемплер сессии хранит хвост предыдущего чанка - границы чанков бесшовные
+            resampler = StreamResampler(audio_format['sample_rate'], target_rate)
+        while True:
+            frames = await ingest_queue.get_batch()
+            if decoder is not None:
+                # Все пакеты пачки - в один тик батч-декодера, результаты склеиваются по порядку
+                decoded = await asyncio.gather(
+                    *(opus_batch_decoder.decode(decoder, packet) for packet in frames), return_exceptions=True
+                )
+                for result in decoded:
+                    if isinstance(result, Exception):
+                        logger.warning(f"[VAD WS] Битый Opus пакет | session={session_id} | error={result}")
+                frame = b''.join(result for result in decoded if not isinstance(result, Exception))
+            else:
+                # Подряд идущие PCM кадры склеиваются и проходят ресемплинг и VAD одним вызовом
+                data = frames[0] if len(frames) == 1 else b''.join(frames)
+                if resampler is not None:
+                    frame = await dsp_executor.run(resampler.process_bytes, data)
+                else:
+                    # Клиент уже пишет в целевой частоте - только выравниваем до int16
+                    frame = data[:len(data) - len(data) % 2]
+
+            if not frame:
+                continue
+            if server_vad:
+                await agent.append_audio(frame)
+            else:
+                await process_audio_chunk(vad_connection_manager, session_id, frame)
+
     async def handle_ping_pong():
         """
         Обработка ping-pong сообщений
@@ -203,7 +327,9 @@ async def websocket_endpoint(websocket: WebSocket):
             while True:
                 try:
                     await agent.read_message(play_queue)
-                    await asyncio.sleep(0.05)
+                    # Сообщения читаются подряд, пауза только пока нет соединения с сессией
+                    if not agent.connection:
+                        await asyncio.sleep(0.05)
                 except asyncio.TimeoutError:
                     continue
 
@@ -211,27 +337,24 @@ async def websocket_endpoint(websocket: WebSocket):
         """
         Цикл для отправки синтезированного аудио ответа
         """
-        last_audio = 0
         play_queue = await vad_connection_manager.get_property(session_id, 'play')
+        playback = await vad_connection_manager.get_property(session_id, 'playback')
         while True:
-            (response_audio, duration) = await play_queue.get()
-            if time.time() - last_audio > 3:
-                await asyncio.sleep(1.4)
-            last_audio = time.time()
-            await vad_connection_manager.send_bytes(session_id, response_audio)
-            #await asyncio.sleep(duration)
-            await asyncio.sleep(0.05)
+            (response_audio, duration, generation) = await play_queue.get()
+            # Темп отправки - по длительности аудио, с небольшим запасом у клиента
+            await playback.send(response_audio, duration, generation)
 
     voice = await vad_connection_manager.get_property(session_id, 'voice')
 
     receive_task = asyncio.create_task(receive_chunk())
+    ingest_task = asyncio.create_task(process_ingest())
     synthesize_task = asyncio.create_task(synthesize_and_queue(voice))
     play_task = asyncio.create_task(play_audio())
     ping_pong_task = asyncio.create_task(handle_ping_pong())
 
     disconnect_reason = "нормальное завершение"
     try:
-        await asyncio.gather(receive_task, synthesize_task, play_task, ping_pong_task)
+        await asyncio.gather(receive_task, ingest_task, synthesize_task, play_task, ping_pong_task)
     except Exception as e:
         disconnect_reason = f"ошибка: {str(e)}"
         logger.error(f"[VAD WS] WebSocket ошибка | user_id={user_id} | session={session_id} | error={str(e)}")
@@ -244,6 +367,7 @@ async def websocket_endpoint(websocket: WebSocket):
         except:
             pass
         
+        ingest_task.cancel()
         synthesize_task.cancel()
         play_task.cancel()
         ping_pong_task.cancel()
@@ -293,6 +417,8 @@ async def websocket_button_endpoint(websocket: WebSocket):
     voice = query_params.get('voice', 'alloy').lower()  # Приводим к нижнему регистру
     topic = query_params.get('topic', None)
     response_length = query_params.get('response_length', 'normal').lower()
+    # Формат исходящего аудио (output_codec, output_framing)
+    output_codec, output_framing = negotiate_output_format(query_params)
     
     # Валидация голоса
     valid_voices = ['alloy', 'ash', 'ballad', 'coral', 'echo', 'sage', 'shimmer', 'verse', 'marin', 'cedar']
@@ -308,6 +434,8 @@ async def websocket_button_endpoint(websocket: WebSocket):
         await button_connection_manager.set_property(session_id, 'topic', topic)
     await button_connection_manager.set_property(session_id, 'voice', voice)
     await button_connection_manager.set_property(session_id, 'response_length', response_length)
+    await button_connection_manager.set_property(session_id, 'output_framing', output_framing)
+    await button_connection_manager.set_property(session_id, 'output_codec', output_codec)
     
     # Сохраняем информацию о пользователе
     await button_connection_manager.set_property(session_id, 'user_id', user_id)
@@ -361,7 +489,9 @@ async def websocket_button_endpoint(websocket: WebSocket):
             while True:
                 try:
                     await agent.read_message(play_queue)
-                    await asyncio.sleep(0.05)
+                    # Сообщения читаются подряд, пауза только пока нет соединения с сессией
+                    if not agent.connection:
+                        await asyncio.sleep(0.05)
                 except asyncio.TimeoutError:
                     continue
 
@@ -369,16 +499,12 @@ async def websocket_button_endpoint(websocket: WebSocket):
         """
         Цикл для отправки синтезированного аудио ответа
         """
-        last_audio = 0
         play_queue = await button_connection_manager.get_property(session_id, 'play')
+        playback = await button_connection_manager.get_property(session_id, 'playback')
         while True:
-            (response_audio, duration) = await play_queue.get()
-            if time.time() - last_audio > 3:
-                await asyncio.sleep(1.4)
-            last_audio = time.time()
-            await button_connection_manager.send_bytes(session_id, response_audio)
-            # await asyncio.sleep(duration)
-            await asyncio.sleep(0.05)
+            (response_audio, duration, generation) = await play_queue.get()
+            # Темп отправки - по длительности аудио, с небольшим запасом у клиента
+            await playback.send(response_audio, duration, generation)
 
     voice = await button_connection_manager.get_property(session_id, 'voice')
 
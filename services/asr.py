@@ -0,0 +1,271 @@
+"""
+Бэкенды распознавания речи (ASR).
+
+Общий интерфейс: transcribe(audio) -> текст.
+audio - файловый объект с WAV (WavStream из памяти или открытый файл).
+  openai - OpenAI Audio API (whisper-1 или gpt-4o-transcribe и т.п.)
+  local  - faster-whisper (CTranslate2, int8 на CPU) в отдельном пуле потоков, без сети.
+faster-whisper - опциональная зависимость, нужна только для ASR_BACKEND=local.
+"""
+import asyncio
+import os
+from abc import ABC, abstractmethod
+import threading
+import time
+from collections import deque
+import logging
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from services.metrics import metrics
+from services.wav import WavStream
+from services.openai_clients import get_openai_client
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s [%(levelname)s] %(message)s',
+    handlers=[logging.StreamHandler(sys.stdout)]
+)
+logger = logging.getLogger("uvicorn")
+
+ASR_BACKEND = os.getenv("ASR_BACKEND", "openai").lower()
+ASR_LANGUAGE = os.getenv("ASR_LANGUAGE") or None  # None - автоопределение языка
+ASR_OPENAI_MODEL = os.getenv("ASR_OPENAI_MODEL", "whisper-1")
+ASR_LOCAL_MODEL = os.getenv("ASR_LOCAL_MODEL", "small")
+ASR_LOCAL_COMPUTE_TYPE = os.getenv("ASR_LOCAL_COMPUTE_TYPE", "int8")
+ASR_LOCAL_WORKERS = int(os.getenv("ASR_LOCAL_WORKERS", "2"))
+ASR_LOCAL_CPU_THREADS = int(os.getenv("ASR_LOCAL_CPU_THREADS", "2"))
+
+# Хеджирование: второй запрос, если первый не уложился в перцентиль задержки
+ASR_HEDGE_ENABLED = os.getenv("ASR_HEDGE_ENABLED", "false").lower() == "true"
+ASR_HEDGE_PERCENTILE = float(os.getenv("ASR_HEDGE_PERCENTILE", "0.9"))
+ASR_HEDGE_MIN_DELAY_MS = float(os.getenv("ASR_HEDGE_MIN_DELAY_MS", "300"))
+ASR_HEDGE_DEFAULT_DELAY_MS = float(os.getenv("ASR_HEDGE_DEFAULT_DELAY_MS", "1500"))  # Пока мало замеров
+ASR_HEDGE_MAX_RATIO = float(os.getenv("ASR_HEDGE_MAX_RATIO", "0.1"))  # Не больше доли от всех запросов
+ASR_HEDGE_BURST = float(os.getenv("ASR_HEDGE_BURST", "5"))
+
+class ASRBackend(ABC):
+    """Базовый класс бэкенда: замеры и счетчики, реализация - в _transcribe"""
+
+    name = 'base'
+    hedgeable = False  # Имеет ли смысл дублировать медленные запросы
+
+    def start(self):
+        """Подготовка бэкенда на старте приложения (загрузка модели и т.п.)"""
+
+    async def transcribe(self, audio) -> str:
+        started = time.perf_counter()
+        metrics.inc(f'asr_requests_{self.name}_total')
+        try:
+            return await self._transcribe(audio)
+        except Exception:
+            metrics.inc(f'asr_errors_{self.name}_total')
+            raise
+        finally:
+            metrics.observe(f'asr_seconds_{self.name}', time.perf_counter() - started)
+
+    @abstractmethod
+    async def _transcribe(self, audio) -> str:
+        """Распознает аудио целиком, возвращает текст"""
+
+
+class OpenAIASR(ASRBackend):
+    """Распознавание через OpenAI Audio API"""
+
+    name = 'openai'
+    hedgeable = True
+
+    def __init__(self, model: str = ASR_OPENAI_MODEL, language: str = ASR_LANGUAGE):
+        self.model = model
+        self.language = language
+        self.client = get_openai_client()
+
+    def _params(self, audio) -> dict:
+        params = {'model': self.model, 'file': audio}
+        if self.language:
+            params['language'] = self.language
+        return params
+
+    async def _transcribe(self, audio) -> str:
+        transcript = await self.client.audio.transcriptions.create(**self._params(audio))
+        return transcript.text
+
+
+class LocalWhisperASR(ASRBackend):
+    """Локальный faster-whisper на CPU в собственном пуле потоков (CTranslate2 отпускает GIL)"""
+
+    name = 'local'
+
+    def __init__(self, model: str = ASR_LOCAL_MODEL, compute_type: str = ASR_LOCAL_COMPUTE_TYPE,
+                 workers: int = ASR_LOCAL_WORKERS, cpu_threads: int = ASR_LOCAL_CPU_THREADS,
+                 language: str = ASR_LANGUAGE):
+        self.model_name = model
+        self.compute_type = compute_type
+        self.workers = workers
+        self.cpu_threads = cpu_threads
+        self.language = language
+        self._model = None
+        self._model_lock = threading.Lock()
+        self._executor = None
+
+    def start(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="asr")
+            # Модель грузится в фоне, чтобы первая реплика не ждала загрузку
+            self._executor.submit(self._load)
+
+    def _load(self):
+        with self._model_lock:
+            if self._model is None:
+                from faster_whisper import WhisperModel
+
+                started = time.perf_counter()
+                self._model = WhisperModel(
+                    self.model_name, device='cpu', compute_type=self.compute_type,
+                    cpu_threads=self.cpu_threads, num_workers=self.workers,
+                )
+                logger.info(f"[ASR] Локальная модель загружена | model={self.model_name} | "
+                            f"compute={self.compute_type} | workers={self.workers} | "
+                            f"load_seconds={time.perf_counter() - started:.2f}")
+        return self._model
+
+    @staticmethod
+    def _input(audio):
+        # PCM 16 кГц из памяти отдаем массивом, без разбора WAV через ffmpeg
+        if isinstance(audio, WavStream) and audio.sample_rate == 16000:
+            return np.frombuffer(audio.pcm, np.int16).astype(np.float32) * (1 / 32768)
+        return audio
+
+    def _segments(self, audio):
+        segments, _ = self._load().transcribe(
+            self._input(audio), language=self.language, beam_size=1, vad_filter=False,
+        )
+        return segments
+
+    async def _transcribe(self, audio) -> str:
+        self.start()
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, lambda: ''.join(segment.text for segment in self._segments(audio)).strip()
+        )
+
+
+ASR_BACKENDS = {
+    OpenAIASR.name: OpenAIASR,
+    LocalWhisperASR.name: LocalWhisperASR,
+}
+
+
+def create_asr_backend(name: str = ASR_BACKEND) -> ASRBackend:
+    if name not in ASR_BACKENDS:
+        raise ValueError(f"Unknown ASR backend: {name}")
+    return ASR_BACKENDS[name]()
+
+
+class ASRHedger:
+    """
+    Хеджирование запросов распознавания.
+
+    Если запрос не вернулся за перцентиль наблюдаемой задержки, отправляется второй такой же,
+    берется первый ответ, второй отменяется. Число хеджей ограничено общим бюджетом:
+    каждый запрос добавляет max_ratio токена (не больше burst), хедж тратит один.
+    """
+
+    MIN_SAMPLES = 20
+
+    def __init__(self, enabled: bool = ASR_HEDGE_ENABLED, percentile: float = ASR_HEDGE_PERCENTILE,
+                 min_delay_ms: float = ASR_HEDGE_MIN_DELAY_MS, default_delay_ms: float = ASR_HEDGE_DEFAULT_DELAY_MS,
+                 max_ratio: float = ASR_HEDGE_MAX_RATIO, burst: float = ASR_HEDGE_BURST):
+        self.enabled = enabled
+        self.percentile = percentile
+        self.min_delay = min_delay_ms / 1000
+        self.default_delay = default_delay_ms / 1000
+        self.max_ratio = max_ratio
+        self.burst = burst
+        self.tokens = burst
+        self.latencies = deque(maxlen=500)  # Задержки основных запросов (с); отмененные - время до отмены
+        self.requests = 0
+        self.hedges = 0
+        self.wins = 0
+
+    def delay(self) -> float:
+        """Сколько ждать первый запрос перед хеджем"""
+        if len(self.latencies) < self.MIN_SAMPLES:
+            return self.default_delay
+        ordered = sorted(self.latencies)
+        return max(ordered[int(self.percentile * (len(ordered) - 1))], self.min_delay)
+
+    async def transcribe(self, backend: ASRBackend, make_audio) -> str:
+        """
+        :param make_audio: async функция, возвращающая новый файловый объект с аудио
+            (у каждого запроса свой поток чтения)
+        """
+        if not (self.enabled and backend.hedgeable):
+            return await backend.transcribe(await make_audio())
+
+        self.requests += 1
+        self.tokens = min(self.burst, self.tokens + self.max_ratio)
+        primary = asyncio.create_task(self._timed(backend, make_audio, record=True))
+        tasks = [primary]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.delay())
+            if done:
+                return primary.result()
+            if self.tokens < 1:
+                metrics.inc('asr_hedge_skipped_budget_total')
+                return await primary
+
+            self.tokens -= 1
+            self.hedges += 1
+            metrics.inc('asr_hedge_fired_total')
+            hedge = asyncio.create_task(self._timed(backend, make_audio))
+            tasks.append(hedge)
+
+            pending = set(tasks)
+            first_error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                # При одновременном завершении предпочитаем основной запрос
+                for task in sorted(done, key=lambda t: t is not primary):
+                    if task.exception() is None:
+                        if task is hedge:
+                            self.wins += 1
+                            metrics.inc('asr_hedge_won_total')
+                        return task.result()
+                    first_error = first_error or task.exception()
+            raise first_error
+        finally:
+            for task in tasks:
+                task.cancel()
+            if self.requests:
+                metrics.set_gauge('asr_hedge_rate', round(self.hedges / self.requests, 4))
+            if self.hedges:
+                metrics.set_gauge('asr_hedge_win_rate', round(self.wins / self.hedges, 4))
+
+    async def _timed(self, backend: ASRBackend, make_audio, record: bool = False) -> str:
+        """
+        Запрос с замером задержки. Выборка - только основные запросы: основной, проигравший хеджу
+        и отмененный, записывается временем до отмены (оценка снизу), иначе в окне остались бы
+        только быстрые ответы и порог хеджа смещался бы вниз.
+        """
+        started = time.perf_counter()
+        try:
+            text = await backend.transcribe(await make_audio())
+        except asyncio.CancelledError:
+            if record:
+                self.latencies.append(time.perf_counter() - started)
+            raise
+        if record:
+            self.latencies.append(time.perf_counter() - started)
+        return text
+
+
+# Глобальный бэкенд распознавания для vad_realtime и button_realtime
+asr_backend = create_asr_backend()
+asr_hedger = ASRHedger()
+
+
+async def transcribe_audio(make_audio) -> str:
+    """Распознает аудио глобальным бэкендом с хеджированием (если включено)"""
+    return await asr_hedger.transcribe(asr_backend, make_audio)
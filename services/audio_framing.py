@@ -0,0 +1,148 @@
+"""
+Упаковка исходящего аудио ответа для отправки клиенту.
+
+Дельты PCM16 24 кГц из realtime сессии склеиваются в пакеты фиксированной длительности
+(OUTBOUND_PACKET_MS), длительность пакета считается по числу байт. Пакет собирается одним
+b''.join из заголовка и memoryview на PCM, без BytesIO и модуля wave.
+  wav    - каждый пакет отдельный WAV (заголовок на пакет), как ждет текущий фронтенд;
+  stream - один потоковый WAV заголовок в начале ответа, дальше сырой PCM.
+С кодеком opus пакет - один кадр OUTBOUND_OPUS_FRAME_MS, закодированный энкодером сессии
+в DSP пуле (одно бинарное сообщение - один Opus пакет, без заголовков).
+"""
+import os
+
+from services.metrics import metrics
+from services.dsp_executor import dsp_executor
+from services.wav import wav_header, WAV_HEADER_SIZE
+from services.opus_codec import (
+    opus_available, create_encoder, encode_frames,
+    OUTBOUND_OPUS_BITRATE, OUTBOUND_OPUS_FRAME_MS, OPUS_ENCODER_FRAME_MS,
+)
+
+OUTBOUND_FRAMING = os.getenv("OUTBOUND_FRAMING", "wav").lower()
+OUTBOUND_PACKET_MS = int(os.getenv("OUTBOUND_PACKET_MS", "100"))  # 0 - без склейки, пакет на дельту
+OUTBOUND_CODEC = os.getenv("OUTBOUND_CODEC", "pcm16").lower()
+
+FRAMING_WAV = 'wav'
+FRAMING_STREAM = 'stream'
+FRAMINGS = (FRAMING_WAV, FRAMING_STREAM)
+
+CODEC_PCM16 = 'pcm16'
+CODEC_OPUS = 'opus'
+CODECS = (CODEC_PCM16, CODEC_OPUS)
+
+OUTBOUND_SAMPLE_RATE = 24000
+# Длина данных в потоковом заголовке неизвестна: максимально возможная (RIFF размер 0xFFFFFFFF)
+STREAM_DATA_SIZE = 0xFFFFFFFF - 36
+
+
+class OutboundAudioFramer:
+    """Склейка дельт одного ответа в пакеты (по экземпляру на сессию)"""
+
+    def __init__(self, framing: str = OUTBOUND_FRAMING, packet_ms: int = OUTBOUND_PACKET_MS,
+                 sample_rate: int = OUTBOUND_SAMPLE_RATE, codec: str = OUTBOUND_CODEC):
+        self.framing = framing if framing in FRAMINGS else FRAMING_WAV
+        self.codec = resolve_codec(codec)
+        self.sample_rate = sample_rate
+        self.bytes_per_second = sample_rate * 2
+        self.packet_ms = packet_ms
+        self.packet_bytes = packet_bytes(self.codec, sample_rate, packet_ms)
+        # Энкодер только для opus; формат для клиента - describe_format, без создания энкодера
+        self.encoder = create_encoder(sample_rate) if self.codec == CODEC_OPUS else None
+        self.pending = bytearray()  # Хвост меньше пакета
+        self.stream_started = False
+
+    def push(self, pcm) -> list:
+        """Добавляет дельту PCM16, возвращает готовые пакеты [(bytes, duration)]"""
+        view = memoryview(pcm).cast('B')
+        if not self.packet_bytes:
+            return [self._packet(view)] if len(view) else []
+
+        packets = []
+        if self.pending:
+            need = self.packet_bytes - len(self.pending)
+            self.pending += view[:need]
+            view = view[need:]
+            if len(self.pending) < self.packet_bytes:
+                return packets
+            packets.append(self._packet(self.pending))
+            self.pending = bytearray()
+
+        full = len(view) - len(view) % self.packet_bytes
+        for offset in range(0, full, self.packet_bytes):
+            packets.append(self._packet(view[offset:offset + self.packet_bytes]))
+        self.pending += view[full:]
+        return packets
+
+    def flush(self) -> list:
+        """Конец ответа: отдает хвост, следующий ответ начнется с нового заголовка"""
+        packets = []
+        if self.pending:
+            if self.encoder is not None:
+                # Кадр Opus - только полной длины: хвост добивается тишиной
+                self.pending += bytes(self.packet_bytes - len(self.pending))
+            packets.append(self._packet(self.pending))
+        self.reset()
+        return packets
+
+    def reset(self):
+        """Сброс без отправки (ответ отменен)"""
+        self.pending = bytearray()
+        self.stream_started = False
+
+    async def encode(self, packets) -> list:
+        """Кодирует пакеты в Opus в DSP пуле (для pcm16 - как есть), формат (bytes, duration) сохраняется"""
+        if self.encoder is not None and packets:
+            encoded = await dsp_executor.run(encode_frames, self.encoder, [pcm for pcm, _ in packets])
+            packets = [(data, duration) for data, (_, duration) in zip(encoded, packets)]
+        metrics.inc(f'outbound_audio_bytes_{self.codec}_total', sum(len(data) for data, _ in packets))
+        return packets
+
+    def _packet(self, pcm):
+        size = len(pcm)
+        duration = size / self.bytes_per_second
+        if self.encoder is not None:
+            return bytes(pcm), duration
+        if self.framing == FRAMING_WAV:
+            return b''.join((wav_header(size, self.sample_rate), pcm)), duration
+        if not self.stream_started:
+            self.stream_started = True
+            return b''.join((wav_header(STREAM_DATA_SIZE, self.sample_rate), pcm)), duration
+        return bytes(pcm), duration
+
+    def describe(self) -> dict:
+        return describe_format(self.codec, self.framing, self.sample_rate, self.packet_ms)
+
+
+def resolve_codec(codec: str) -> str:
+    """Opus - только если opuslib доступен, иначе pcm16"""
+    return CODEC_OPUS if codec == CODEC_OPUS and opus_available() else CODEC_PCM16
+
+
+def packet_bytes(codec: str, sample_rate: int = OUTBOUND_SAMPLE_RATE, packet_ms: int = OUTBOUND_PACKET_MS) -> int:
+    if codec == CODEC_OPUS:
+        # Энкодер принимает только кадры фиксированной длительности
+        packet_ms = OUTBOUND_OPUS_FRAME_MS if OUTBOUND_OPUS_FRAME_MS in OPUS_ENCODER_FRAME_MS else 20
+    return sample_rate * 2 * packet_ms // 1000 // 2 * 2
+
+
+def describe_format(codec: str, framing: str, sample_rate: int = OUTBOUND_SAMPLE_RATE,
+                    packet_ms: int = OUTBOUND_PACKET_MS) -> dict:
+    """Описание формата исходящего аудио для клиента (сообщение о формате) - только по настройкам"""
+    codec = resolve_codec(codec)
+    packet_ms = packet_bytes(codec, sample_rate, packet_ms) * 1000 // (sample_rate * 2)
+    if codec == CODEC_OPUS:
+        return {
+            'codec': CODEC_OPUS,
+            'sample_rate': sample_rate,
+            'framing': 'packet_per_message',
+            'packet_ms': packet_ms,
+            'bitrate': OUTBOUND_OPUS_BITRATE,
+        }
+    return {
+        'codec': CODEC_PCM16,
+        'sample_rate': sample_rate,
+        'framing': framing if framing in FRAMINGS else FRAMING_WAV,
+        'packet_ms': packet_ms,
+        'header_bytes': WAV_HEADER_SIZE,
+    }
@@ -0,0 +1,98 @@
+"""
+Выделенный пул потоков для DSP и инференса VAD.
+
+Синхронная работа torch/numpy (ресемплинг, конвертация, прогон Silero) выполняется
+здесь, чтобы не блокировать event loop: пинги, /api и остальные сокеты остаются отзывчивыми.
+"""
+import asyncio
+import functools
+import os
+import time
+import logging
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from services.metrics import metrics
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s [%(levelname)s] %(message)s',
+    handlers=[logging.StreamHandler(sys.stdout)]
+)
+logger = logging.getLogger("uvicorn")
+
+DSP_WORKERS = int(os.getenv("DSP_WORKERS", str(min(4, os.cpu_count() or 1))))
+DSP_TORCH_THREADS = int(os.getenv("DSP_TORCH_THREADS", "1"))
+LOOP_LAG_INTERVAL_MS = float(os.getenv("LOOP_LAG_INTERVAL_MS", "100"))
+
+
+def _set_torch_threads(torch_threads: int):
+    """
+    Число intra-op потоков torch. Настройка общая на весь процесс (не на поток),
+    поэтому задается один раз при запуске пула и действует на все воркеры и остальной код.
+    """
+    try:
+        import torch
+        torch.set_num_threads(torch_threads)
+    except ImportError:
+        pass
+
+
+class DSPExecutor:
+    """Пул потоков для синхронной аудио-обработки"""
+
+    def __init__(self, workers: int = DSP_WORKERS, torch_threads: int = DSP_TORCH_THREADS):
+        self.workers = workers
+        self.torch_threads = torch_threads
+        self._executor = None
+
+    def start(self):
+        if self._executor is None:
+            _set_torch_threads(self.torch_threads)
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="dsp")
+            logger.info(f"[DSP] Пул запущен | workers={self.workers} | torch_threads={self.torch_threads}")
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def run(self, func, *args, **kwargs):
+        """Выполняет синхронную функцию в пуле и ждет результат"""
+        if self._executor is None:
+            self.start()
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        try:
+            return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+        finally:
+            metrics.observe('dsp_task_seconds', time.perf_counter() - started)
+
+
+class LoopLagMonitor:
+    """
+    Измеряет, насколько event loop опаздывает с пробуждением таймера.
+    Опоздание = время, в течение которого loop был заблокирован синхронной работой.
+    """
+
+    def __init__(self, interval_ms: float = LOOP_LAG_INTERVAL_MS):
+        self.interval = interval_ms / 1000
+        self._task = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - started - self.interval)
+            metrics.observe('event_loop_lag_seconds', lag)
+            metrics.set_gauge('event_loop_lag_last_seconds', round(lag, 6))
+
+
+# Глобальные экземпляры
+dsp_executor = DSPExecutor()
+loop_lag_monitor = LoopLagMonitor()
@@ -0,0 +1,127 @@
+"""
+Общий реестр клиентов OpenAI на процесс.
+
+Один AsyncOpenAI на ключ API: realtime агенты, транскрибация и Assistants используют общий
+пул HTTP соединений с keep-alive вместо отдельного пула и TLS рукопожатий на каждую сессию.
+Состояние пула (запросы в работе, открытые и простаивающие соединения) пишется в метрики.
+"""
+import os
+import time
+import threading
+import logging
+import sys
+
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+from services.metrics import metrics
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s [%(levelname)s] %(message)s',
+    handlers=[logging.StreamHandler(sys.stdout)]
+)
+logger = logging.getLogger("uvicorn")
+
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "100"))
+OPENAI_MAX_KEEPALIVE = int(os.getenv("OPENAI_MAX_KEEPALIVE", "20"))
+OPENAI_KEEPALIVE_EXPIRY_S = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY_S", "60"))
+OPENAI_CONNECT_TIMEOUT_S = float(os.getenv("OPENAI_CONNECT_TIMEOUT_S", "5"))
+OPENAI_TIMEOUT_S = float(os.getenv("OPENAI_TIMEOUT_S", "60"))
+
+
+class InstrumentedTransport(httpx.AsyncHTTPTransport):
+    """Транспорт httpx со счетчиком запросов в работе и замером времени до заголовков ответа"""
+
+    def __init__(self, registry, **kwargs):
+        super().__init__(**kwargs)
+        self.registry = registry
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        started = time.perf_counter()
+        self.registry.in_flight += 1
+        metrics.inc('openai_http_requests_total')
+        self.registry.publish()
+        try:
+            response = await super().handle_async_request(request)
+        except Exception:
+            metrics.inc('openai_http_errors_total')
+            raise
+        finally:
+            self.registry.in_flight -= 1
+            self.registry.publish()
+        metrics.observe('openai_http_headers_seconds', time.perf_counter() - started)
+        return response
+
+    def pool_connections(self) -> list:
+        return list(getattr(self._pool, 'connections', ()))
+
+
+class OpenAIClientRegistry:
+    """Реестр клиентов OpenAI: один клиент и один пул соединений на ключ API"""
+
+    def __init__(self):
+        self._clients = {}
+        self._transports = []
+        self._lock = threading.Lock()
+        self.in_flight = 0
+
+    def get(self, api_key: str = None) -> AsyncOpenAI:
+        api_key = api_key or os.getenv("OPENAI_API_KEY")
+        client = self._clients.get(api_key)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(api_key)
+                if client is None:
+                    client = AsyncOpenAI(api_key=api_key, http_client=self._create_http_client())
+                    self._clients[api_key] = client
+                    logger.info(f"[OPENAI] Создан общий клиент | max_connections={OPENAI_MAX_CONNECTIONS} | "
+                                f"max_keepalive={OPENAI_MAX_KEEPALIVE}")
+        return client
+
+    def _create_http_client(self) -> httpx.AsyncClient:
+        # Лимиты пула задаются на транспорте: при своем транспорте limits клиента не применяются
+        transport = InstrumentedTransport(
+            self,
+            limits=httpx.Limits(
+                max_connections=OPENAI_MAX_CONNECTIONS,
+                max_keepalive_connections=OPENAI_MAX_KEEPALIVE,
+                keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY_S,
+            ),
+        )
+        self._transports.append(transport)
+        return DefaultAsyncHttpxClient(
+            transport=transport,
+            timeout=httpx.Timeout(OPENAI_TIMEOUT_S, connect=OPENAI_CONNECT_TIMEOUT_S),
+        )
+
+    def pool_stats(self) -> dict:
+        """Запросы в работе, открытые и простаивающие соединения всех пулов"""
+        connections = [c for transport in self._transports for c in transport.pool_connections()]
+        return {
+            'clients': len(self._clients),
+            'in_flight': self.in_flight,
+            'connections': len(connections),
+            'idle_connections': sum(1 for connection in connections if connection.is_idle()),
+        }
+
+    def publish(self):
+        stats = self.pool_stats()
+        metrics.set_gauge('openai_http_in_flight', stats['in_flight'])
+        metrics.set_gauge('openai_http_connections', stats['connections'])
+        metrics.set_gauge('openai_http_idle_connections', stats['idle_connections'])
+
+    async def close(self):
+        for client in self._clients.values():
+            await client.close()
+        self._clients.clear()
+        self._transports.clear()
+
+
+# Глобальный реестр клиентов
+openai_clients = OpenAIClientRegistry()
+
+
+def get_openai_client(api_key: str = None) -> AsyncOpenAI:
+    """Общий клиент OpenAI для ключа (по умолчанию OPENAI_API_KEY)"""
+    return openai_clients.get(api_key)
@@ -0,0 +1,129 @@
+"""
+Opus кодек для аудио клиентов.
+
+Входящие пакеты от всех сессий собираются за короткий тик и декодируются одной задачей
+в DSP пуле, вместо отдельного перехода в пул на каждый пакет.
+Исходящее аудио ответа кодируется энкодером сессии в том же DSP пуле (OUTBOUND_CODEC=opus).
+opuslib - опциональная зависимость (нужна системная libopus): без нее Opus не предлагается клиентам.
+"""
+import asyncio
+import os
+import time
+import logging
+import sys
+
+from services.metrics import metrics
+from services.dsp_executor import dsp_executor
+
+try:
+    import opuslib
+except Exception:  # Нет пакета или системной libopus
+    opuslib = None
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s [%(levelname)s] %(message)s',
+    handlers=[logging.StreamHandler(sys.stdout)]
+)
+logger = logging.getLogger("uvicorn")
+
+OPUS_DECODE_TICK_MS = float(os.getenv("OPUS_DECODE_TICK_MS", "5"))
+OPUS_MAX_FRAME_MS = 120  # Максимальная длительность одного Opus пакета
+OUTBOUND_OPUS_BITRATE = int(os.getenv("OUTBOUND_OPUS_BITRATE", "32000"))
+OUTBOUND_OPUS_FRAME_MS = int(os.getenv("OUTBOUND_OPUS_FRAME_MS", "20"))
+OPUS_ENCODER_FRAME_MS = (10, 20, 40, 60)  # Длительности кадра, которые принимает энкодер
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+
+def opus_available() -> bool:
+    return opuslib is not None
+
+
+def create_decoder(sample_rate: int = 16000):
+    """Создает декодер одной сессии (моно, PCM int16 на выходе)"""
+    if opuslib is None:
+        raise RuntimeError("opuslib is not installed")
+    decoder = opuslib.Decoder(sample_rate, 1)
+    decoder.sample_rate = sample_rate
+    return decoder
+
+
+def create_encoder(sample_rate: int = 24000, bitrate: int = OUTBOUND_OPUS_BITRATE):
+    """Создает энкодер исходящего аудио одной сессии (моно, речь)"""
+    if opuslib is None:
+        raise RuntimeError("opuslib is not installed")
+    encoder = opuslib.Encoder(sample_rate, 1, opuslib.APPLICATION_VOIP)
+    encoder.bitrate = bitrate
+    return encoder
+
+
+def encode_frames(encoder, frames) -> list:
+    """Кодирует кадры PCM int16 одной сессии по порядку, кадр - один Opus пакет"""
+    return [encoder.encode(bytes(frame), len(frame) // 2) for frame in frames]
+
+
+def _decode_all(items):
+    """Декодирует пакеты всех сессий за один заход в DSP пул"""
+    results = []
+    for decoder, packet in items:
+        try:
+            frame_size = decoder.sample_rate * OPUS_MAX_FRAME_MS // 1000
+            results.append(decoder.decode(bytes(packet), frame_size))
+        except Exception as e:
+            results.append(e)
+    return results
+
+
+class OpusBatchDecoder:
+    """Батчевый декодер входящих Opus пакетов"""
+
+    def __init__(self, tick_ms: float = OPUS_DECODE_TICK_MS):
+        self.tick = tick_ms / 1000
+        self.pending = []  # (декодер, пакет, future)
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def decode(self, decoder, packet: bytes) -> bytes:
+        """Ставит пакет в очередь и ждет PCM int16"""
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((decoder, packet, future))
+        self._wakeup.set()
+        return await future
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            await asyncio.sleep(self.tick)
+            self._wakeup.clear()
+
+            batch, self.pending = self.pending, []
+            batch = [item for item in batch if not item[2].done()]
+            if not batch:
+                continue
+
+            started = time.perf_counter()
+            metrics.observe('opus_decode_batch_size', len(batch), buckets=BATCH_SIZE_BUCKETS)
+            try:
+                results = await dsp_executor.run(_decode_all, [(decoder, packet) for decoder, packet, _ in batch])
+            except Exception as e:
+                logger.error(f"[OPUS] Ошибка декодирования батча | batch={len(batch)} | error={e}")
+                results = [e] * len(batch)
+            metrics.observe('opus_decode_batch_seconds', time.perf_counter() - started)
+
+            for (_, _, future), result in zip(batch, results):
+                if future.done():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+
+# Глобальный экземпляр декодера
+opus_batch_decoder = OpusBatchDecoder()
@@ -0,0 +1,100 @@
+"""
+Планировщик отправки аудио ответа клиенту (jitter buffer).
+
+Вместо фиксированных пауз отправка идет по длительности аудио: клиенту уходит столько
+звука, чтобы у него в буфере было не больше PLAYBACK_JITTER_MS сверх того, что уже играет.
+Первый пакет ответа отправляется сразу. Время от конца реплики пользователя до первого
+отправленного байта ответа (TTFB) пишется в метрики по каждой реплике.
+Курсор воспроизведения (сколько аудио текущего ответа клиент уже проиграл) нужен для
+обрезки ответа модели при перебивании (barge-in).
+"""
+import asyncio
+import os
+import time
+import logging
+import sys
+
+from services.metrics import metrics
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s [%(levelname)s] %(message)s',
+    handlers=[logging.StreamHandler(sys.stdout)]
+)
+logger = logging.getLogger("uvicorn")
+
+PLAYBACK_JITTER_MS = float(os.getenv("PLAYBACK_JITTER_MS", "150"))
+
+
+class PlaybackScheduler:
+    """Темп отправки аудио одной сессии"""
+
+    def __init__(self, send, jitter_ms: float = PLAYBACK_JITTER_MS, name: str = ''):
+        """
+        :param send: async функция отправки байт клиенту
+        :param jitter_ms: Сколько аудио держать у клиента в запасе сверх текущего момента
+        """
+        self.send_bytes = send
+        self.jitter = jitter_ms / 1000
+        self.name = name
+        self.play_until = 0.0  # Момент (monotonic), когда у клиента закончится отправленное аудио
+        self.response_sent = 0.0  # Отправлено аудио текущего ответа (с)
+        self.generation = 0  # Меняется при сбросе: пакет, ждавший своей очереди, уже не отправляется
+        self.turn_started_at = None
+
+    def mark_turn_start(self):
+        """Конец реплики пользователя: от этого момента считается TTFB ответа"""
+        self.turn_started_at = time.perf_counter()
+
+    def buffered(self) -> float:
+        """Сколько отправленного аудио (с) еще не проиграно клиентом"""
+        return max(self.play_until - time.monotonic(), 0.0)
+
+    def start_response(self):
+        """Начало аудио нового ответа: курсор воспроизведения с нуля"""
+        self.response_sent = 0.0
+
+    def played(self) -> float:
+        """Курсор воспроизведения: сколько аудио текущего ответа (с) клиент уже проиграл"""
+        return max(self.response_sent - self.buffered(), 0.0)
+
+    def stop(self, play_queue=None):
+        """
+        Перебивание: клиент сбрасывает свой буфер, пакеты в ожидании не отправляются.
+        Очередь отправки очищается синхронно, до любого await вызывающего кода.
+        """
+        self.generation += 1
+        self.play_until = 0.0
+        self.response_sent = 0.0
+        while play_queue is not None and not play_queue.empty():
+            play_queue.get_nowait()
+
+    async def send(self, data: bytes, duration: float, generation: int = None):
+        """
+        Отправляет пакет, не опережая воспроизведение больше чем на jitter.
+        generation - значение self.generation на момент постановки пакета в очередь:
+        пакет, поставленный до сброса, не отправляется.
+        """
+        if generation is None:
+            generation = self.generation
+        elif generation != self.generation:
+            return
+        now = time.monotonic()
+        if self.play_until < now:
+            # Клиент доиграл все отправленное: новый ответ стартует сразу
+            self.play_until = now
+        lead = self.play_until - now
+        if lead > self.jitter:
+            await asyncio.sleep(lead - self.jitter)
+            if generation != self.generation:
+                return
+
+        await self.send_bytes(data)
+        self.play_until += duration or 0
+        self.response_sent += duration or 0
+
+        if self.turn_started_at is not None:
+            ttfb = time.perf_counter() - self.turn_started_at
+            self.turn_started_at = None
+            metrics.observe('playback_ttfb_seconds', ttfb)
+            logger.info(f"[PLAYBACK] Первый байт ответа | session={self.name} | ttfb_ms={ttfb * 1000:.0f}")
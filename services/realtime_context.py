@@ -0,0 +1,196 @@
+"""
+Бюджет токенов контекста realtime сессии.
+
+Каждая реплика остается в разговоре сессии, и input_tokens ответа растет с каждым ходом.
+RealtimeContext ведет список элементов разговора с оценкой токенов каждого (по usage ответов:
+выходные токены - репликам ассистента, прирост входных - новым репликам пользователя).
+Инструкции сессии входят во вход каждого ответа, но элементами не являются: их доля
+оценивается по первому ответу (базовая линия) и в бюджет и распределение не попадает.
+Когда элементы превышают бюджет, самые старые удаляются (conversation.item.delete)
+или сворачиваются в краткое содержание - системный элемент в начале разговора.
+Инструкции сессии (session.update) элементами разговора не являются и не затрагиваются,
+последние keep_items элементов не трогаются никогда.
+"""
+import asyncio
+import os
+import logging
+import sys
+
+from services.metrics import metrics
+from services.openai_clients import get_openai_client
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s [%(levelname)s] %(message)s',
+    handlers=[logging.StreamHandler(sys.stdout)]
+)
+logger = logging.getLogger("uvicorn")
+
+REALTIME_CONTEXT_BUDGET_TOKENS = int(os.getenv("REALTIME_CONTEXT_BUDGET_TOKENS", "0"))  # 0 - выключено
+REALTIME_CONTEXT_KEEP_ITEMS = int(os.getenv("REALTIME_CONTEXT_KEEP_ITEMS", "6"))
+REALTIME_CONTEXT_PRUNE_MODE = os.getenv("REALTIME_CONTEXT_PRUNE_MODE", "delete").lower()  # delete | summarize
+REALTIME_CONTEXT_SUMMARY_MODEL = os.getenv("REALTIME_CONTEXT_SUMMARY_MODEL", "gpt-4o-mini")
+PRUNE_TARGET_RATIO = 0.7  # После обрезки контекст - не больше этой доли бюджета
+CHARS_PER_TOKEN = 4  # Грубая оценка токенов текста реплики для базовой линии
+
+PRUNE_DELETE = 'delete'
+PRUNE_SUMMARIZE = 'summarize'
+
+TOKEN_BUCKETS = (250, 500, 1000, 2000, 4000, 8000, 16000, 32000, 64000, 128000)
+
+SUMMARY_PROMPT = (
+    "Кратко перескажи начало разговора пользователя с голосовым ассистентом: темы, факты о пользователе, "
+    "договоренности. Пиши на языке разговора, не больше 5 предложений."
+)
+SUMMARY_PREFIX = "Краткое содержание начала разговора: "
+
+
+def _item_text(item) -> str:
+    """Текст элемента разговора из его содержимого (текст или транскрипт аудио)"""
+    parts = []
+    for content in getattr(item, 'content', None) or []:
+        text = getattr(content, 'text', None) or getattr(content, 'transcript', None)
+        if text:
+            parts.append(text)
+    return ' '.join(parts)
+
+
+class RealtimeContext:
+    """Элементы разговора одной realtime сессии и их доля в контексте"""
+
+    def __init__(self, budget_tokens: int = REALTIME_CONTEXT_BUDGET_TOKENS, keep_items: int = REALTIME_CONTEXT_KEEP_ITEMS,
+                 mode: str = REALTIME_CONTEXT_PRUNE_MODE, summary_model: str = REALTIME_CONTEXT_SUMMARY_MODEL):
+        self.budget = budget_tokens
+        self.keep_items = keep_items
+        self.mode = mode if mode in (PRUNE_DELETE, PRUNE_SUMMARIZE) else PRUNE_DELETE
+        self.summary_model = summary_model
+        self.items = []  # [{'id', 'role', 'text', 'tokens'}] в порядке разговора
+        self.base_tokens = None  # Инструкции сессии и прочий вход вне элементов, по первому ответу
+        self.context_tokens = 0  # Оценка размера элементов разговора после последнего ответа
+        self._prune_task = None
+
+    def _find(self, item_id):
+        for item in self.items:
+            if item['id'] == item_id:
+                return item
+        return None
+
+    def on_event(self, message):
+        """Обновляет список элементов по событиям сессии"""
+        if message.type == 'conversation.item.created':
+            item = message.item
+            if getattr(item, 'type', None) != 'message':
+                return
+            entry = {'id': item.id, 'role': item.role, 'text': _item_text(item), 'tokens': None}
+            previous = getattr(message, 'previous_item_id', None)
+            if previous is None:
+                self.items.insert(0, entry)
+            else:
+                index = next((i for i, old in enumerate(self.items) if old['id'] == previous), len(self.items) - 1)
+                self.items.insert(index + 1, entry)
+        elif message.type == 'conversation.item.deleted':
+            item = self._find(message.item_id)
+            if item:
+                self.items.remove(item)
+        elif message.type in ('conversation.item.input_audio_transcription.completed',
+                              'response.audio_transcript.done'):
+            item = self._find(message.item_id)
+            if item:
+                item['text'] = message.transcript
+
+    def on_response_done(self, response) -> bool:
+        """
+        Распределяет usage ответа по элементам, пишет метрики.
+        Возвращает True, если контекст превысил бюджет и пора обрезать.
+        """
+        usage = getattr(response, 'usage', None)
+        if not usage:
+            return False
+        input_tokens = getattr(usage, 'input_tokens', 0) or 0
+        output_tokens = getattr(usage, 'output_tokens', 0) or 0
+        metrics.observe('realtime_input_tokens', input_tokens, buckets=TOKEN_BUCKETS)
+
+        output_ids = {getattr(item, 'id', None) for item in getattr(response, 'output', None) or []}
+        outputs = [item for item in self.items if item['id'] in output_ids]
+        new_inputs = [item for item in self.items if item['tokens'] is None and item['id'] not in output_ids]
+        if self.base_tokens is None:
+            # Первый ответ: во входе еще инструкции сессии. Их доля - вход минус аудио и оценка текста
+            # новых элементов; дальше она не приписывается элементам и не считается в бюджет
+            details = getattr(usage, 'input_token_details', None)
+            audio_tokens = getattr(details, 'audio_tokens', 0) or 0
+            text_tokens = sum(len(item['text']) for item in new_inputs) / CHARS_PER_TOKEN
+            self.base_tokens = max(input_tokens - audio_tokens - text_tokens, 0)
+        # Прирост входа сверх прошлого контекста - новые элементы (реплика пользователя, сводка)
+        added = max(input_tokens - self.base_tokens - self.context_tokens, 0)
+        for item in new_inputs:
+            item['tokens'] = added / len(new_inputs)
+        for item in outputs:
+            item['tokens'] = output_tokens / len(outputs)
+
+        self.context_tokens = max(input_tokens - self.base_tokens, 0) + output_tokens
+        return bool(self.budget) and self.context_tokens > self.budget
+
+    def schedule_prune(self, connection):
+        """Обрезка в фоне, чтобы не задерживать чтение событий сессии"""
+        if self._prune_task is None or self._prune_task.done():
+            self._prune_task = asyncio.create_task(self.prune(connection))
+
+    async def prune(self, connection):
+        excess = self.context_tokens - self.budget * PRUNE_TARGET_RATIO
+        victims = []
+        freed = 0
+        for item in self.items[:max(len(self.items) - self.keep_items, 0)]:
+            if freed >= excess:
+                break
+            victims.append(item)
+            freed += item['tokens'] or 0
+        if not victims:
+            return
+
+        summary = None
+        if self.mode == PRUNE_SUMMARIZE:
+            summary = await self._summarize(victims)
+
+        try:
+            for item in victims:
+                await connection.conversation.item.delete(item_id=item['id'])
+                if item in self.items:
+                    self.items.remove(item)
+            if summary:
+                await connection.conversation.item.create(
+                    previous_item_id='root',
+                    item={
+                        "type": "message",
+                        "role": "system",
+                        "content": [{"type": "input_text", "text": SUMMARY_PREFIX + summary}],
+                    },
+                )
+                metrics.inc('realtime_context_summaries_total')
+        except Exception as e:
+            logger.error(f"[CONTEXT] Ошибка обрезки контекста | error={e}")
+            return
+        self.context_tokens = max(self.context_tokens - freed, 0)
+        metrics.inc('realtime_context_pruned_items_total', len(victims))
+        logger.info(f"[CONTEXT] Контекст обрезан | mode={self.mode} | items={len(victims)} | "
+                    f"freed_tokens~{freed:.0f} | budget={self.budget}")
+
+    async def _summarize(self, items):
+        """Краткое содержание удаляемых элементов (прошлая сводка входит в них же); None при ошибке"""
+        transcript = '\n'.join(f"{item['role']}: {item['text']}" for item in items if item['text'])
+        if not transcript:
+            return None
+        try:
+            completion = await get_openai_client().chat.completions.create(
+                model=self.summary_model,
+                messages=[{"role": "system", "content": SUMMARY_PROMPT}, {"role": "user", "content": transcript}],
+                temperature=0.2,
+            )
+            return completion.choices[0].message.content.strip()
+        except Exception as e:
+            logger.warning(f"[CONTEXT] Не удалось сделать сводку, элементы просто удаляются | error={e}")
+            return None
+
+    def close(self):
+        if self._prune_task is not None:
+            self._prune_task.cancel()
+            self._prune_task = None
@@ -0,0 +1,176 @@
+"""
+Пул заранее открытых realtime сессий OpenAI.
+
+Подключение к realtime (TLS, WebSocket рукопожатие, session.created) занимает заметное время,
+и без пула пользователь ждет его после открытия своего сокета. Пул держит по несколько готовых
+соединений на модель: при подключении пользователя соединение забирается из пула, получает
+session.update с инструкциями и голосом сессии, а после разговора закрывается (повторно не
+используется). Пул сразу досоздает забранное соединение в фоне.
+Соединения старше max_age пересоздаются: у провайдера есть лимит длительности сессии, и время
+ожидания в пуле вычитается из разговора пользователя. Поэтому max_age небольшой, а возраст
+выданного соединения пишется в метрику realtime_pool_checkout_age_seconds.
+Если за idle_s соединения ни разу не забирали, пул закрывает готовые соединения и не пополняется
+до следующего подключения пользователя (оно идет холодным и снова запускает пополнение).
+"""
+import asyncio
+import os
+import time
+from collections import deque
+import logging
+import sys
+
+from services.metrics import metrics
+from services.openai_clients import get_openai_client
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s [%(levelname)s] %(message)s',
+    handlers=[logging.StreamHandler(sys.stdout)]
+)
+logger = logging.getLogger("uvicorn")
+
+REALTIME_POOL_SIZE = int(os.getenv("REALTIME_POOL_SIZE", "2"))  # Готовых соединений на модель, 0 - без пула
+REALTIME_POOL_MODELS = [model.strip() for model in
+                        os.getenv("REALTIME_POOL_MODELS", "gpt-4o-realtime-preview-2024-12-17").split(",")
+                        if model.strip()]
+REALTIME_POOL_MAX_AGE_S = float(os.getenv("REALTIME_POOL_MAX_AGE_S", "120"))
+REALTIME_POOL_IDLE_S = float(os.getenv("REALTIME_POOL_IDLE_S", "900"))  # 0 - пополнять всегда
+REALTIME_POOL_RETRY_S = 5  # Пауза после ошибки подключения при пополнении пула
+AGE_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600)
+
+
+class RealtimeSessionPool:
+    """Готовые realtime соединения по моделям"""
+
+    def __init__(self, size: int = REALTIME_POOL_SIZE, models=REALTIME_POOL_MODELS,
+                 max_age_s: float = REALTIME_POOL_MAX_AGE_S, idle_s: float = REALTIME_POOL_IDLE_S,
+                 api_key: str = None):
+        self.size = size
+        self.models = list(models)
+        self.max_age = max_age_s
+        self.idle = idle_s
+        self._last_checkout = {}  # model -> время последнего запроса соединения (monotonic)
+        self.api_key = api_key
+        self._ready = {}  # model -> deque[(connection, created_at)]
+        self._refill_events = {}  # model -> asyncio.Event, будит фоновое пополнение
+        self._tasks = []
+
+    def start(self):
+        """Запускает фоновое пополнение пула (вызывается на старте приложения)"""
+        if self.size <= 0 or self._tasks:
+            return
+        for model in self.models:
+            self._ready.setdefault(model, deque())
+            self._refill_events[model] = asyncio.Event()
+            self._last_checkout[model] = time.monotonic()
+            self._tasks.append(asyncio.create_task(self._refill_loop(model)))
+        logger.info(f"[REALTIME POOL] Запущен | size={self.size} | models={','.join(self.models)}")
+
+    async def _connect(self, model: str):
+        """Холодное подключение: TLS, WebSocket и создание сессии"""
+        started = time.perf_counter()
+        connection = await get_openai_client(self.api_key).beta.realtime.connect(model=model).enter()
+        metrics.observe('realtime_connect_seconds', time.perf_counter() - started)
+        return connection
+
+    async def _refill_loop(self, model: str):
+        ready = self._ready[model]
+        event = self._refill_events[model]
+        while True:
+            try:
+                if self.idle and time.monotonic() - self._last_checkout[model] > self.idle:
+                    # Пользователей нет: готовые соединения не держим, ждем следующего подключения.
+                    # Событие сбрасывается до закрытия - подключение во время закрытия не потеряется
+                    event.clear()
+                    while ready:
+                        connection, _ = ready.popleft()
+                        await self._close(connection)
+                    self._publish()
+                    logger.info(f"[REALTIME POOL] Простой, пополнение остановлено | model={model}")
+                    await event.wait()
+                    continue
+                # Старые соединения закрываем заранее, чтобы не отдать пользователю почти истекшую сессию
+                while ready and time.monotonic() - ready[0][1] > self.max_age:
+                    connection, _ = ready.popleft()
+                    await self._close(connection)
+                while len(ready) < self.size:
+                    ready.append((await self._connect(model), time.monotonic()))
+                self._publish()
+                event.clear()
+                try:
+                    await asyncio.wait_for(event.wait(), timeout=self.max_age / 4)
+                except asyncio.TimeoutError:
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                metrics.inc('realtime_pool_connect_errors_total')
+                logger.warning(f"[REALTIME POOL] Ошибка пополнения | model={model} | error={e}")
+                await asyncio.sleep(REALTIME_POOL_RETRY_S)
+
+    async def _checkout(self, model: str):
+        """Готовое соединение из пула или None"""
+        ready = self._ready.get(model)
+        while ready:
+            connection, created_at = ready.popleft()
+            age = time.monotonic() - created_at
+            if age <= self.max_age:
+                metrics.observe('realtime_pool_checkout_age_seconds', age, buckets=AGE_BUCKETS)
+                return connection
+            await self._close(connection)
+        return None
+
+    async def open(self, model: str, session: dict):
+        """
+        Возвращает realtime соединение модели с примененными настройками сессии.
+
+        Берет готовое соединение из пула, если есть, иначе подключается заново.
+        Если готовое соединение оказалось закрытым, один раз подключается заново.
+        """
+        started = time.perf_counter()
+        connection = await self._checkout(model)
+        warm = connection is not None
+        if model in self._refill_events:
+            self._last_checkout[model] = time.monotonic()
+            self._refill_events[model].set()
+            self._publish()
+
+        if warm:
+            try:
+                await connection.session.update(session=session)
+            except Exception as e:
+                logger.warning(f"[REALTIME POOL] Готовое соединение недоступно, подключаемся заново | "
+                               f"model={model} | error={e}")
+                await self._close(connection)
+                warm = False
+        if not warm:
+            connection = await self._connect(model)
+            await connection.session.update(session=session)
+
+        kind = 'warm' if warm else 'cold'
+        metrics.inc(f'realtime_pool_{kind}_total')
+        metrics.observe(f'realtime_ready_seconds_{kind}', time.perf_counter() - started)
+        return connection
+
+    def _publish(self):
+        metrics.set_gauge('realtime_pool_ready', sum(len(ready) for ready in self._ready.values()))
+
+    @staticmethod
+    async def _close(connection):
+        try:
+            await connection.close()
+        except Exception:
+            pass
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks.clear()
+        for ready in self._ready.values():
+            while ready:
+                connection, _ = ready.popleft()
+                await self._close(connection)
+
+
+# Глобальный пул realtime сессий для vad_realtime и button_realtime
+realtime_pool = RealtimeSessionPool()
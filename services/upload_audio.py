@@ -0,0 +1,77 @@
+"""
+Подготовка высказывания к отправке в ASR.
+
+По умолчанию - WAV из памяти без копирования (WavStream). Опционально PCM сжимается
+в FLAC (без потерь) или Ogg/Opus через soundfile (libsndfile) в DSP пуле.
+soundfile - опциональная зависимость: без нее всегда отправляется WAV.
+Экономия байт относительно полного WAV высказывания пишется в метрики.
+"""
+import io
+import os
+import logging
+import sys
+
+import numpy as np
+
+from services.metrics import metrics
+from services.dsp_executor import dsp_executor
+from services.wav import WavStream, WAV_HEADER_SIZE
+
+try:
+    import soundfile
+except Exception:  # Нет пакета или системной libsndfile
+    soundfile = None
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s [%(levelname)s] %(message)s',
+    handlers=[logging.StreamHandler(sys.stdout)]
+)
+logger = logging.getLogger("uvicorn")
+
+UPLOAD_AUDIO_FORMAT = os.getenv("UPLOAD_AUDIO_FORMAT", "wav").lower()
+
+FORMAT_WAV = 'wav'
+FORMAT_FLAC = 'flac'
+FORMAT_OPUS = 'opus'
+
+# Формат soundfile, подтип и имя файла (по расширению ASR определяет контейнер)
+_SOUNDFILE_FORMATS = {
+    FORMAT_FLAC: ('FLAC', 'PCM_16', 'audio.flac'),
+    FORMAT_OPUS: ('OGG', 'OPUS', 'audio.ogg'),
+}
+
+
+def _encode(pcm, sample_rate: int, fmt: str) -> io.BytesIO:
+    container, subtype, name = _SOUNDFILE_FORMATS[fmt]
+    buffer = io.BytesIO()
+    soundfile.write(buffer, np.frombuffer(pcm, np.int16), sample_rate, format=container, subtype=subtype)
+    buffer.seek(0)
+    buffer.name = name
+    return buffer
+
+
+async def prepare_upload(pcm, sample_rate: int = 16000, fmt: str = UPLOAD_AUDIO_FORMAT):
+    """
+    Упаковывает PCM16 моно в файловый объект для ASR.
+
+    :param fmt: wav | flac | opus
+    """
+    if fmt in _SOUNDFILE_FORMATS and soundfile is not None:
+        try:
+            return await dsp_executor.run(_encode, pcm, sample_rate, fmt)
+        except Exception as e:
+            logger.warning(f"[ASR UPLOAD] Не удалось сжать аудио, отправляем WAV | format={fmt} | error={e}")
+    return WavStream(pcm, sample_rate)
+
+
+def record_upload(upload, original_bytes: int):
+    """
+    Метрики отправленных и сэкономленных байт - один раз на высказывание
+    (хедж-дубли и отброшенные спекулятивные запросы не считаются).
+
+    :param original_bytes: Размер PCM до обрезки тишины
+    """
+    size = upload.getbuffer().nbytes if isinstance(upload, io.BytesIO) else len(upload)
+    metrics.inc('asr_upload_bytes_total', size)
+    metrics.inc('asr_upload_bytes_saved_total', max(WAV_HEADER_SIZE + original_bytes - size, 0))
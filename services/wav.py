@@ -0,0 +1,100 @@
+"""
+WAV упаковка PCM без копирования и без диска.
+
+wav_header строит 44-байтный заголовок, WavStream отдает заголовок и PCM (memoryview)
+как один файловый поток - его можно передавать прямо в клиент транскрибации.
+Запись на диск - только в режиме отладки AUDIO_DEBUG_CAPTURE.
+"""
+import asyncio
+import io
+import os
+import struct
+import time
+import uuid
+import logging
+import sys
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s [%(levelname)s] %(message)s',
+    handlers=[logging.StreamHandler(sys.stdout)]
+)
+logger = logging.getLogger("uvicorn")
+
+AUDIO_DEBUG_CAPTURE = os.getenv("AUDIO_DEBUG_CAPTURE", "false").lower() == "true"
+AUDIO_DEBUG_DIR = os.getenv("AUDIO_DEBUG_DIR", "temp/debug_audio")
+
+WAV_HEADER_SIZE = 44
+
+
+def wav_header(data_size: int, sample_rate: int = 16000, channels: int = 1, sample_width: int = 2) -> bytes:
+    """Заголовок RIFF/WAVE для PCM данных длиной data_size байт"""
+    byte_rate = sample_rate * channels * sample_width
+    return struct.pack(
+        '<4sI4s4sIHHIIHH4sI',
+        b'RIFF', 36 + data_size, b'WAVE',
+        b'fmt ', 16, 1, channels, sample_rate, byte_rate, channels * sample_width, sample_width * 8,
+        b'data', data_size,
+    )
+
+
+class WavStream(io.RawIOBase):
+    """Файловый поток WAV: заголовок + PCM без склейки в один буфер"""
+
+    def __init__(self, pcm, sample_rate: int = 16000, name: str = 'audio.wav'):
+        self.pcm = memoryview(pcm).cast('B')
+        self.sample_rate = sample_rate
+        self.header = wav_header(len(self.pcm), sample_rate)
+        self.name = name  # По имени клиент определяет формат
+        self.position = 0
+
+    def __len__(self) -> int:
+        return WAV_HEADER_SIZE + len(self.pcm)
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self.position, io.SEEK_END: len(self)}[whence]
+        self.position = min(max(base + offset, 0), len(self))
+        return self.position
+
+    def readinto(self, buffer) -> int:
+        out = memoryview(buffer).cast('B')
+        written = 0
+        while written < len(out) and self.position < len(self):
+            if self.position < WAV_HEADER_SIZE:
+                source = memoryview(self.header)[self.position:]
+            else:
+                source = self.pcm[self.position - WAV_HEADER_SIZE:]
+            n = min(len(source), len(out) - written)
+            out[written:written + n] = source[:n]
+            written += n
+            self.position += n
+        return written
+
+
+def _write_debug_wav(path: str, stream: WavStream):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(stream.header)
+        f.write(stream.pcm)
+
+
+async def capture_debug_wav(pcm, sample_rate: int = 16000, tag: str = 'utterance'):
+    """Сохраняет высказывание на диск, если включен AUDIO_DEBUG_CAPTURE. Имя файла уникально."""
+    if not AUDIO_DEBUG_CAPTURE:
+        return None
+    path = os.path.join(AUDIO_DEBUG_DIR, f"{tag}_{int(time.time() * 1000)}_{uuid.uuid4().hex[:8]}.wav")
+    try:
+        await asyncio.to_thread(_write_debug_wav, path, WavStream(pcm, sample_rate))
+    except OSError as e:
+        logger.error(f"[AUDIO DEBUG] Не удалось сохранить файл | path={path} | error={e}")
+        return None
+    return path
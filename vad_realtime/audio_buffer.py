@@ -0,0 +1,108 @@
+"""
+Буфер высказывания для VAD записи.
+
+Предвыделенный bytearray с курсором записи: длина и отступ тишины считаются за O(1),
+готовое высказывание отдается как memoryview без копирования.
+"""
+
+# 16 кГц, int16 моно: 32000 байт на секунду
+BYTES_PER_SECOND = 32000
+
+
+class UtteranceBuffer:
+    """Буфер одного высказывания пользователя (PCM 16 кГц int16 моно)"""
+
+    def __init__(self, capacity: int = BYTES_PER_SECOND * 10):
+        """
+        :param capacity: Начальный размер буфера в байтах (по умолчанию 10 секунд)
+        """
+        self.initial_capacity = capacity
+        self._data = bytearray(capacity)
+        self._cursor = 0  # Курсор записи
+        self.last_voice_offset = 0  # Отступ, на котором последний раз был обнаружен голос
+        self.start_sample = 0  # Номер сэмпла сессии (счетчик VAD), с которого начинается буфер
+        self.speech_start = None  # Начало первой речи высказывания по VAD (сэмпл сессии)
+        self.speech_end = None  # Конец последней речи высказывания по VAD (сэмпл сессии)
+
+    def __len__(self) -> int:
+        return self._cursor
+
+    @property
+    def silence_length(self) -> int:
+        """Количество байт, записанных после последнего голосового чанка"""
+        return self._cursor - self.last_voice_offset
+
+    def start(self, preroll_chunks=()):
+        """Начинает новое высказывание и записывает pre-roll чанки"""
+        self._cursor = 0
+        self.last_voice_offset = 0
+        self.speech_start = None
+        self.speech_end = None
+        for chunk in preroll_chunks:
+            self.write(chunk)
+
+    def mark_voice(self):
+        """Отмечает текущую позицию курсора как место последнего голоса"""
+        self.last_voice_offset = self._cursor
+
+    def align(self, total_samples: int):
+        """Привязывает конец буфера к счетчику сэмплов VAD сессии (после записи чанка)"""
+        self.start_sample = total_samples - self._cursor // 2
+
+    def mark_speech(self, start: int = None, end: int = None):
+        """Запоминает границы речи по событиям VAD (в сэмплах сессии)"""
+        if start is not None and self.speech_start is None:
+            self.speech_start = start
+        if end is not None:
+            self.speech_end = end
+
+    def speech_range(self, pad_bytes: int = 0) -> tuple:
+        """
+        Байтовый диапазон высказывания без тишины до и после речи (с запасом pad_bytes).
+        Если границы речи неизвестны, возвращается весь буфер.
+        """
+        start, end = 0, self._cursor
+        if self.speech_start is not None:
+            start = max(0, (self.speech_start - self.start_sample) * 2 - pad_bytes)
+        if self.speech_end is not None and (self.speech_start is None or self.speech_end > self.speech_start):
+            end = min(self._cursor, (self.speech_end - self.start_sample) * 2 + pad_bytes)
+        if end <= start:
+            return 0, self._cursor
+        return start, end
+
+    def write(self, chunk):
+        """Дописывает чанк в буфер, при нехватке места удваивает емкость"""
+        size = len(chunk)
+        end = self._cursor + size
+        if end > len(self._data):
+            self._grow(end)
+        self._data[self._cursor:end] = chunk
+        self._cursor = end
+
+    def view(self) -> memoryview:
+        """Возвращает memoryview на записанные данные (без копирования)"""
+        return memoryview(self._data)[:self._cursor]
+
+    def detach(self) -> memoryview:
+        """
+        Отдает записанное высказывание как memoryview и переключает буфер на новое хранилище.
+
+        Старое хранилище больше не изменяется, поэтому view остается валидным,
+        пока идет транскрибация, даже если в это время началось новое высказывание.
+        """
+        data = self.view()
+        self._data = bytearray(self.initial_capacity)
+        self._cursor = 0
+        self.last_voice_offset = 0
+        self.speech_start = None
+        self.speech_end = None
+        return data
+
+    def _grow(self, required: int):
+        # Новое хранилище вместо resize: на старое могут ссылаться выданные memoryview
+        capacity = len(self._data) or self.initial_capacity
+        while capacity < required:
+            capacity *= 2
+        data = bytearray(capacity)
+        data[:self._cursor] = memoryview(self._data)[:self._cursor]
+        self._data = data
@@ -1,11 +1,15 @@
 import asyncio
+import functools
 import time
-import io
+import uuid
 from fastapi import WebSocket
 from datetime import datetime
 
-from .prod_config import INSTRUCTIONS_4
+from .prod_config import INSTRUCTIONS_4, VAD_INPUT_MODE
 from .llm_utils import AsyncOpenAIAgent
+from services.playback import PlaybackScheduler
+from services.audio_framing import OUTBOUND_FRAMING, OUTBOUND_CODEC
+from .audio_buffer import UtteranceBuffer
 
 import logging
 import sys
@@ -34,11 +38,14 @@ class ConnectionManager:
                 'queue': audio_queue, # Очередь синтеза аудио
                 'chat_history': [], # История разговора
                 'play': play_queue, # Очередь отправки аудио
+                'playback': PlaybackScheduler(functools.partial(self.send_bytes, client_ip), name=client_ip), # Темп отправки аудио клиенту
                 'socket': websocket, # Вебсокет, по которому происходит связь с клиентом
-                'audio_buffer': io.BytesIO(), # Аудиобуфер, в который копятся чанки перед отправкой на транскрибацию
+                'audio_buffer': UtteranceBuffer(), # Аудиобуфер, в который копятся чанки перед отправкой на транскрибацию
                 'temporary_buffer': [], # Аудиобуфер с чанками, в который начинают писаться аудио в случае обнаружения голоса
                 'is_recording': False, # Идет ли запись аудио
-                'last_voice_time': time.time(), # Когда последний раз был обнаружен голос
+                'vad': None, # Потоковый VAD сессии, создается при первом чанке
+                'endpointer': None, # Адаптивный детектор конца реплики, создается вместе с VAD
+                'speculative_asr': None, # Спекулятивное распознавание во время паузы (задача и длина аудио)
                 'thread': None, # История разговора OpenAI данного соединения
                 'llm_task': None, # Поток генерации ответа от LLM
                 'voice': 1,
@@ -86,8 +93,11 @@ class ConnectionManager:
             return self.connections[client_ip]['queue']
 
     async def disconnect(self, client_ip: str):
+        from .transcribation_utils import cancel_speculative_transcription
         async with self.lock:
             if client_ip in self.connections:
+                # Незавершенное спекулятивное распознавание не должно пережить сессию
+                cancel_speculative_transcription(self.connections[client_ip])
                 try:
                     await self.connections[client_ip]['socket'].close()
                 except:
@@ -180,6 +190,22 @@ class ConnectionManager:
 
 
 
+def start_request_tracking(connection) -> str:
+    """Заводит запрос в очереди учета времени и делает его текущим, возвращает request_id"""
+    request_id = str(uuid.uuid4())
+    connection['current_request_id'] = request_id
+    connection['time_tracking_queue'].append({
+        'request_id': request_id,
+        'recording_start_time': time.time(),
+        'voice_duration': 0,
+        'processing_start_time': None,
+        'processing_duration': 0,
+        'response_start_time': None,
+        'response_duration': 0,
+        'bot_audio_duration': 0  # длительность синтезированного ответа (секунды)
+    })
+    return request_id
+
 async def calculate_and_deduct_time_for_request(connection_manager, client_ip, request_id):
     """Подсчитывает время для конкретного запроса и вычитает из БД"""
     from database import db_handler, seconds_to_minutes_ceil
@@ -301,7 +327,11 @@ async def apply_settings(connection_manager, client_ip):
         instruction += '\n\n## Длина ответа: Старайся делать ответ более длинным.'
     # Для 'normal' ничего не добавляем
     
-    agent = AsyncOpenAIAgent(instruction,connection_manager,client_ip,"gpt-4o-realtime-preview-2024-12-17",voice)
+    input_mode = await connection_manager.get_property(client_ip, 'input_mode') or VAD_INPUT_MODE
+    output_framing = await connection_manager.get_property(client_ip, 'output_framing') or OUTBOUND_FRAMING
+    output_codec = await connection_manager.get_property(client_ip, 'output_codec') or OUTBOUND_CODEC
+    agent = AsyncOpenAIAgent(instruction,connection_manager,client_ip,"gpt-4o-realtime-preview-2024-12-17",voice,
+                             input_mode=input_mode, output_framing=output_framing, output_codec=output_codec)
     await agent.connect()
     await connection_manager.set_property(client_ip, 'agent', agent)
     await connection_manager.send_text(client_ip,'Настройки применены. Ассистент инициализирован.')
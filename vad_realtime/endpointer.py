@@ -0,0 +1,110 @@
+"""
+Адаптивное определение конца реплики (endpointing).
+
+Вместо фиксированной паузы в 2.5 секунды таймаут выбирается в начале каждой паузы:
+  - реплика звучит законченной (энергия к концу фразы затухает) - короткий таймаут;
+  - речь оборвалась на ровной энергии (запинка, "эээ", середина фразы) - длинный таймаут.
+Таймаут не опускается ниже обычных пауз внутри реплик этой сессии (p90), а если после
+отправки пользователь тут же продолжает говорить, сессия становится осторожнее.
+"""
+import time
+from collections import deque
+
+import numpy as np
+
+from services.metrics import metrics
+from .audio_buffer import BYTES_PER_SECOND
+
+SAMPLE_RATE = 16000
+MIN_PAUSE_MS = 150  # Короче - не пауза, а граница слога
+PREMATURE_WINDOW_S = 1.5  # Речь сразу после отправки - преждевременный конец реплики
+MIN_PAUSES_FOR_STATS = 5
+
+
+class Endpointer:
+    """Решает, когда пауза в записи означает конец реплики (одна сессия)"""
+
+    def __init__(self, min_ms: float = 400, complete_ms: float = 700, hesitation_ms: float = 1500,
+                 max_ms: float = 2500, fall_ratio: float = 0.6, guard_ms: float = 130, adaptive: bool = True):
+        """
+        :param min_ms: Нижняя граница таймаута
+        :param complete_ms: Таймаут после законченно звучащей реплики
+        :param hesitation_ms: Таймаут после запинки / оборванной фразы
+        :param max_ms: Верхняя граница таймаута (и фиксированный таймаут при adaptive=False)
+        :param fall_ratio: Во сколько раз энергия конца фразы ниже средней, чтобы считать фразу законченной
+        :param guard_ms: Хвост голосового участка, который VAD держит после конца речи (не учитывается)
+        """
+        self.min_ms = min_ms
+        self.complete_ms = complete_ms
+        self.hesitation_ms = hesitation_ms
+        self.max_ms = max_ms
+        self.fall_ratio = fall_ratio
+        self.guard = int(guard_ms * SAMPLE_RATE / 1000)
+        self.adaptive = adaptive
+        self.pauses = deque(maxlen=20)  # Паузы внутри реплик (мс)
+        self.bias = 1.0  # Множитель таймаутов сессии, растет после преждевременных отправок
+        self.timeout_ms = None  # Таймаут текущей паузы, выбирается один раз в ее начале
+        self.kind = None
+        self.last_endpoint_at = None
+
+    def on_turn_start(self):
+        """Начало новой реплики: проверяем, не оборвали ли мы предыдущую слишком рано"""
+        if self.last_endpoint_at is not None and time.monotonic() - self.last_endpoint_at < PREMATURE_WINDOW_S:
+            self.bias = min(self.bias * 1.25, self.max_ms / self.complete_ms)
+            metrics.inc('endpoint_premature_total')
+        self.last_endpoint_at = None
+        self.timeout_ms = None
+
+    def on_voice(self, pause_bytes: int):
+        """Голос продолжился; pause_bytes - длина только что закончившейся паузы"""
+        pause_ms = pause_bytes * 1000 / BYTES_PER_SECOND
+        if self.timeout_ms is not None and pause_ms >= MIN_PAUSE_MS:
+            self.pauses.append(pause_ms)
+        self.timeout_ms = None
+
+    def should_end(self, buffer) -> bool:
+        """True, если тишина после последнего голоса достигла таймаута текущей паузы"""
+        silence = buffer.silence_length
+        if silence <= 0:
+            return False
+        if self.timeout_ms is None:
+            self.timeout_ms, self.kind = self._choose_timeout(buffer)
+        return silence * 1000 / BYTES_PER_SECOND >= self.timeout_ms
+
+    def on_endpoint(self):
+        """Реплика отправлена: метрики и подготовка к следующей"""
+        timeout_ms = self.timeout_ms or self.max_ms
+        metrics.observe('endpoint_timeout_seconds', timeout_ms / 1000)
+        metrics.observe('endpoint_time_saved_seconds', (self.max_ms - timeout_ms) / 1000)
+        metrics.inc(f'endpoint_{self.kind or "fixed"}_total')
+        # Без преждевременных отправок осторожность постепенно уходит
+        self.bias = max(1.0, self.bias * 0.95)
+        self.last_endpoint_at = time.monotonic()
+        self.timeout_ms = None
+        self.kind = None
+
+    def _choose_timeout(self, buffer):
+        if not self.adaptive:
+            return self.max_ms, 'fixed'
+        complete = self._sounds_complete(buffer)
+        timeout = self.complete_ms if complete else self.hesitation_ms
+        if len(self.pauses) >= MIN_PAUSES_FOR_STATS:
+            # Не обрываем на паузе, обычной для этого пользователя
+            p90 = sorted(self.pauses)[int(0.9 * (len(self.pauses) - 1))]
+            timeout = max(timeout, p90 * 1.2)
+        timeout = min(max(timeout * self.bias, self.min_ms), self.max_ms)
+        return timeout, 'complete' if complete else 'hesitation'
+
+    def _sounds_complete(self, buffer) -> bool:
+        """Затухает ли энергия к концу последнего голосового участка"""
+        speech_end = (len(buffer) - buffer.silence_length) // 2 - self.guard
+        tail = SAMPLE_RATE // 5  # Последние 200 мс речи
+        start = max(speech_end - SAMPLE_RATE, 0)  # Сравниваем с предыдущей секундой
+        if speech_end - start < tail + SAMPLE_RATE // 10:
+            return True  # Очень короткая реплика ("да", "нет") - считаем законченной
+
+        audio = np.frombuffer(buffer.view()[start * 2:speech_end * 2], np.int16).astype(np.float32)
+        body, end = audio[:-tail], audio[-tail:]
+        body_rms = np.sqrt(np.mean(body * body)) + 1e-6
+        end_rms = np.sqrt(np.mean(end * end))
+        return end_rms / body_rms < self.fall_ratio
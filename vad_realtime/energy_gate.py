@@ -0,0 +1,75 @@
+"""
+Дешевый энергетический пре-гейт перед Silero.
+
+Для каждого окна считаются RMS и доля переходов через ноль. Если весь чанк заведомо
+тишина относительно адаптивного уровня шума сессии, модель не вызывается вовсе.
+"""
+import threading
+
+import numpy as np
+
+from services.metrics import metrics
+
+
+class EnergyGate:
+    """Пре-гейт тишины с адаптивным уровнем шума одной сессии"""
+
+    # Общая статистика по всем сессиям для метрики hit-rate
+    _stats_lock = threading.Lock()
+    _chunks_total = 0
+    _chunks_gated = 0
+
+    def __init__(self, ratio: float = 2.0, max_rms: float = 0.01, initial_floor: float = 0.003,
+                 zcr_fricative: float = 0.25):
+        """
+        :param ratio: Во сколько раз окно должно превышать уровень шума, чтобы уйти в модель
+        :param max_rms: Абсолютный потолок порога (доля полной шкалы), выше него гейт не срабатывает
+        :param initial_floor: Начальный уровень шума
+        :param zcr_fricative: Доля переходов через ноль, выше которой тихое окно считается шипящим звуком
+        """
+        self.ratio = ratio
+        self.max_rms = max_rms
+        self.noise_floor = initial_floor
+        self.zcr_fricative = zcr_fricative
+
+    def is_silence(self, windows: np.ndarray, triggered: bool) -> bool:
+        """
+        Проверяет окна int16 формы (k, 512). True - весь чанк тишина, модель можно не вызывать.
+        Во время речи гейт не срабатывает: конец речи определяет модель.
+        Вызывается в DSP пуле вместе с нарезкой на окна (StreamingVAD._split), не на event loop.
+        """
+        audio = windows.astype(np.float32) * (1 / 32768)
+        rms = np.sqrt(np.mean(audio * audio, axis=1))
+        zcr = np.count_nonzero(np.diff(np.signbit(audio), axis=1), axis=1) / (audio.shape[1] - 1)
+
+        level = min(self.noise_floor * self.ratio, self.max_rms)
+        # Тихие, но шумоподобные окна (с, ф, ш) могут быть началом речи
+        fricative = (zcr > self.zcr_fricative) & (rms > self.noise_floor * 1.5)
+        silent = bool(np.all((rms < level) & ~fricative)) and not triggered
+
+        if not triggered:
+            self._adapt(rms)
+        self._record(silent, len(windows))
+        return silent
+
+    def _adapt(self, rms: np.ndarray):
+        """Быстро опускаем уровень шума и медленно поднимаем"""
+        for value in rms:
+            if value < self.noise_floor:
+                self.noise_floor += 0.5 * (value - self.noise_floor)
+            else:
+                self.noise_floor += 0.01 * (min(value, self.max_rms) - self.noise_floor)
+        self.noise_floor = max(self.noise_floor, 1e-5)
+
+    @classmethod
+    def _record(cls, silent: bool, n_windows: int):
+        with cls._stats_lock:
+            cls._chunks_total += 1
+            if silent:
+                cls._chunks_gated += 1
+            hit_rate = cls._chunks_gated / cls._chunks_total
+        metrics.inc('vad_gate_chunks_total')
+        if silent:
+            metrics.inc('vad_gate_hits_total')
+            metrics.inc('vad_gate_windows_saved_total', n_windows)
+        metrics.set_gauge('vad_gate_hit_rate', round(hit_rate, 4))
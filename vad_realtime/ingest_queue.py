@@ -0,0 +1,77 @@
+"""
+Ограниченная очередь входящих аудио-кадров одной /ws сессии.
+
+Чтение сокета отделено от обработки: читатель только кладет кадры в очередь,
+обработчик забирает сразу все накопившиеся кадры и отдает их в VAD одним вызовом.
+При перегрузке очередь не растет бесконечно, а сливает или отбрасывает кадры по политике.
+"""
+import asyncio
+from collections import deque
+
+from services.metrics import metrics
+
+POLICY_MERGE = 'merge'  # Склеивать самые старые кадры (без потери аудио, пока не превышен лимит байт)
+POLICY_DROP_OLDEST = 'drop_oldest'  # Отбрасывать самый старый кадр
+
+QUEUE_DEPTH_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+
+class IngestQueue:
+    """Очередь входящих кадров с коалесингом и обратным давлением"""
+
+    def __init__(self, max_frames: int = 64, max_bytes: int = 441000, coalesce_bytes: int = 44100,
+                 policy: str = POLICY_MERGE, mergeable: bool = True):
+        """
+        :param max_frames: Максимум кадров в очереди
+        :param max_bytes: Максимум байт в очереди, сверх него старые кадры отбрасываются всегда
+        :param coalesce_bytes: Сколько байт максимум отдавать обработчику за один раз
+        :param policy: Что делать при переполнении по числу кадров (merge | drop_oldest)
+        :param mergeable: Можно ли склеивать кадры байтово (PCM - да, Opus пакеты - нет)
+        """
+        self.max_frames = max_frames
+        self.max_bytes = max_bytes
+        self.coalesce_bytes = coalesce_bytes
+        self.policy = policy if mergeable else POLICY_DROP_OLDEST
+        self.frames = deque()
+        self.size = 0
+        self._event = asyncio.Event()
+
+    def __len__(self) -> int:
+        return len(self.frames)
+
+    def put_nowait(self, frame: bytes):
+        """Кладет кадр без ожидания; при переполнении применяет политику"""
+        if len(self.frames) >= self.max_frames:
+            if self.policy == POLICY_MERGE and len(self.frames) >= 2:
+                first = self.frames.popleft()
+                self.frames[0] = first + self.frames[0]
+                metrics.inc('ingest_frames_merged_total')
+            else:
+                self.size -= len(self.frames.popleft())
+                metrics.inc('ingest_frames_dropped_total')
+
+        self.frames.append(frame)
+        self.size += len(frame)
+
+        while self.size > self.max_bytes and len(self.frames) > 1:
+            self.size -= len(self.frames.popleft())
+            metrics.inc('ingest_frames_dropped_total')
+
+        self._event.set()
+
+    async def get_batch(self) -> list:
+        """Ждет кадры и забирает все накопившиеся (не больше coalesce_bytes, минимум один)"""
+        while not self.frames:
+            self._event.clear()
+            await self._event.wait()
+
+        metrics.observe('ingest_queue_depth', len(self.frames), buckets=QUEUE_DEPTH_BUCKETS)
+        batch = [self.frames.popleft()]
+        taken = len(batch[0])
+        while self.frames and taken + len(self.frames[0]) <= self.coalesce_bytes:
+            frame = self.frames.popleft()
+            batch.append(frame)
+            taken += len(frame)
+        self.size -= taken
+        metrics.observe('ingest_coalesced_frames', len(batch), buckets=QUEUE_DEPTH_BUCKETS)
+        return batch
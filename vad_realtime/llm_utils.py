@@ -1,16 +1,24 @@
 import asyncio
 from typing_extensions import override
-from openai import AsyncAssistantEventHandler, AsyncOpenAI
+from openai import AsyncAssistantEventHandler
 import re
 import time
 import logging
 import base64
 import sys
-import io
-import wave
 
-from .prod_config import OPEN_AI_API_KEY
+from .prod_config import (
+    OPEN_AI_API_KEY, REALTIME_TRANSCRIPTION_MODEL,
+    SERVER_VAD_THRESHOLD, SERVER_VAD_SILENCE_MS, SERVER_VAD_PREFIX_PADDING_MS,
+)
 from services.token_logger import token_logger
+from services.openai_clients import get_openai_client
+from services.realtime_pool import realtime_pool
+from services.realtime_context import RealtimeContext
+from services.metrics import metrics
+from services.dsp_executor import dsp_executor
+from services.resampler import resample
+from services.audio_framing import OutboundAudioFramer, OUTBOUND_FRAMING, OUTBOUND_CODEC
 
 logging.basicConfig(
     level=logging.INFO,
@@ -19,14 +27,24 @@ logging.basicConfig(
 )
 logger = logging.getLogger("uvicorn")
 
-client = AsyncOpenAI(api_key=OPEN_AI_API_KEY)
+client = get_openai_client(OPEN_AI_API_KEY)
+
+# Как реплика пользователя попадает в realtime сессию
+INPUT_MODE_WHISPER = 'whisper'  # Транскрибация Whisper, затем текстом
+INPUT_MODE_AUDIO = 'audio'  # PCM прямо во входной аудио-буфер сессии
+INPUT_MODE_SERVER_VAD = 'server_vad'  # Непрерывный поток аудио, конец реплики определяет провайдер
+INPUT_MODES = (INPUT_MODE_WHISPER, INPUT_MODE_AUDIO, INPUT_MODE_SERVER_VAD)
+
+REALTIME_SAMPLE_RATE = 24000
+APPEND_CHUNK_BYTES = REALTIME_SAMPLE_RATE * 2  # Одно событие append - до 1 секунды PCM16
 
 
 class AsyncOpenAIAgent:
-    def __init__(self, instructions, connection_manager, client_ip, model, voice):
+    def __init__(self, instructions, connection_manager, client_ip, model, voice, input_mode=INPUT_MODE_WHISPER,
+                 output_framing=OUTBOUND_FRAMING, output_codec=OUTBOUND_CODEC):
         """ Initialize voice assistant. """
 
-        self.client = AsyncOpenAI(api_key=OPEN_AI_API_KEY)
+        self.client = get_openai_client(OPEN_AI_API_KEY)
         self.instructions = instructions
         self.handler = connection_manager
         self.client_ip = client_ip
@@ -35,33 +53,58 @@ class AsyncOpenAIAgent:
         self.connection = None
         self._is_running = False
         self._generating = False
+        self.input_mode = input_mode if input_mode in INPUT_MODES else INPUT_MODE_WHISPER
+        self.turn_started_at = None  # Конец реплики пользователя, для метрики задержки до первого аудио
+        self.current_request_id = None
+        self.response_request_id = None  # Запрос, к которому относится текущий ответ
+        self.audio_framer = OutboundAudioFramer(output_framing, codec=output_codec)  # Пакеты исходящего аудио
+        self.context = RealtimeContext()  # Элементы разговора сессии и бюджет токенов контекста
+        self.audio_item_id = None  # Реплика ассистента, аудио которой сейчас отправляется
+        self.audio_item_duration = 0.0  # Сколько аудио этой реплики получено от модели (с)
+        self.response_id = None  # Ответ, который сейчас генерируется (по response.created)
+        self.interrupted_response_id = None  # Ответ, прерванный пользователем: его поздние дельты отбрасываются
+        self._cancel_pending = False  # Перебивание до response.created: ответ отменяется, как только придет
 
     async def connect(self):
         """Start the assistant and establish connection."""
         if self._is_running:
             return
-        self.connection = await self.client.beta.realtime.connect(
-            model=self.model
-        ).enter()
-
-        await self.connection.session.update(
+        # Готовое соединение из пула (или новое, если пул пуст) сразу с настройками сессии
+        self.connection = await realtime_pool.open(
+            self.model,
             session={
                 "modalities": ["text", "audio"],
                 "instructions": self.instructions,
                 "voice": self.voice,
-                "input_audio_transcription": None,
-                "turn_detection": None,
+                # В аудио-режимах текст реплики приходит событием транскрибации от самой сессии
+                "input_audio_transcription": (
+                    {"model": REALTIME_TRANSCRIPTION_MODEL} if self.input_mode != INPUT_MODE_WHISPER else None
+                ),
+                "turn_detection": self._turn_detection(),
                 "temperature": 0.6
             }
         )
 
         self._is_running = True
 
+    def _turn_detection(self):
+        """Настройки серверного детектора речи: только в режиме server_vad"""
+        if self.input_mode != INPUT_MODE_SERVER_VAD:
+            return None
+        return {
+            "type": "server_vad",
+            "threshold": SERVER_VAD_THRESHOLD,
+            "silence_duration_ms": SERVER_VAD_SILENCE_MS,
+            "prefix_padding_ms": SERVER_VAD_PREFIX_PADDING_MS,
+            "create_response": True,
+        }
+
     async def disconnect(self):
         """Stop the assistant and close connection."""
         if not self._is_running:
             return
         self._is_running = False
+        self.context.close()
 
         if self.connection:
             await self.connection.close()
@@ -72,10 +115,58 @@ class AsyncOpenAIAgent:
             try:
                 if self._generating == True:
                     await self.connection.response.cancel()
+                    self.interrupted_response_id = self.response_id
                 self._generating = False
+                self.audio_framer.reset()
             except Exception as e:
                 logger.error(f"[MY_LOG] AOAIAgent_cancel: {e}")
 
+    def _playback(self):
+        connection = self.handler.connections.get(self.client_ip)
+        return connection.get('playback') if connection else None
+
+    async def interrupt(self):
+        """
+        Перебивание (barge-in): пользователь заговорил поверх ответа.
+        Отменяет генерацию, обрезает реплику ассистента в истории сессии по курсору воспроизведения
+        (модель "помнит" только услышанное) и сбрасывает еще не отправленное аудио.
+        """
+        playback = self._playback()
+        played = playback.played() if playback else 0.0
+        # Допуск на округление: ответ, доигранный до конца, не обрезаем
+        playing = self.audio_item_id is not None and self.audio_item_duration - played > 0.01
+        if not (self._generating or playing):
+            return
+        if playback:
+            connection = self.handler.connections.get(self.client_ip)
+            playback.stop(connection['play'])
+        self.audio_framer.reset()
+        if self._generating:
+            if self.response_id is not None:
+                self.interrupted_response_id = self.response_id
+            else:
+                # response.create уже отправлен, но ответ еще не создан - отменим его по response.created
+                self._cancel_pending = True
+        metrics.inc('barge_in_total')
+
+        if self._is_running and self.connection:
+            try:
+                if self._generating:
+                    if self.response_id is not None:
+                        await self.connection.response.cancel()
+                    self._generating = False
+                if playing:
+                    await self.connection.conversation.item.truncate(
+                        item_id=self.audio_item_id, content_index=0, audio_end_ms=int(played * 1000)
+                    )
+                    metrics.observe('barge_in_unplayed_seconds', self.audio_item_duration - played)
+            except Exception as e:
+                logger.error(f"[MY_LOG] AOAIAgent_interrupt: {e}")
+        logger.info(f"[BARGE-IN] Ответ прерван | session={self.client_ip} | played_ms={played * 1000:.0f} | "
+                    f"received_ms={self.audio_item_duration * 1000:.0f}")
+        self.audio_item_id = None
+        self.audio_item_duration = 0.0
+
     async def send_text(self, text, request_id=None):
         # Сохраняем request_id для этого запроса
         self.current_request_id = request_id
@@ -95,6 +186,35 @@ class AsyncOpenAIAgent:
             await self.connection.response.create()
             self._generating = True
 
+    def mark_turn_start(self):
+        """Отмечает конец реплики пользователя (момент срабатывания эндпоинта VAD)"""
+        self.turn_started_at = time.perf_counter()
+        connection = self.handler.connections.get(self.client_ip)
+        if connection and connection.get('playback'):
+            connection['playback'].mark_turn_start()
+
+    async def send_audio(self, pcm16k, request_id=None):
+        """
+        Отправляет реплику аудио: PCM16 16 кГц ресемплится в 24 кГц, дописывается во входной
+        буфер сессии и коммитится, после чего запрашивается ответ. Whisper не вызывается.
+        """
+        self.current_request_id = request_id
+        if self._is_running and self.connection:
+            if self._generating:
+                await self.cancel()
+            pcm24k = await dsp_executor.run(resample, bytes(pcm16k), 16000, REALTIME_SAMPLE_RATE)
+            for offset in range(0, len(pcm24k), APPEND_CHUNK_BYTES):
+                chunk = pcm24k[offset:offset + APPEND_CHUNK_BYTES]
+                await self.connection.input_audio_buffer.append(audio=base64.b64encode(chunk).decode())
+            await self.connection.input_audio_buffer.commit()
+            await self.connection.response.create()
+            self._generating = True
+
+    async def append_audio(self, pcm24k):
+        """Дописывает кадр PCM16 24 кГц во входной буфер сессии (режим server_vad, без commit)"""
+        if self._is_running and self.connection:
+            await self.connection.input_audio_buffer.append(audio=base64.b64encode(pcm24k).decode())
+
     async def read_message(self, play_queue):
         """Чтение и обработка сообщений"""
         if not self.connection:
@@ -104,25 +224,97 @@ class AsyncOpenAIAgent:
             await self._handle_message(self.message, play_queue)
             # await asyncio.sleep(0.05)
 
+    async def _queue_audio(self, packets, play_queue):
+        """Ставит пакеты в очередь отправки и копит длительность ответа для текущего запроса"""
+        # Поколение - до кодирования: перебивание во время encode отбросит эти пакеты
+        playback = self._playback()
+        generation = playback.generation if playback else None
+        packets = await self.audio_framer.encode(packets)
+        for data, duration in packets:
+            await play_queue.put((data, duration, generation))
+        duration = sum(packet[1] for packet in packets)
+        if not duration:
+            return
+        try:
+            connection = self.handler.connections.get(self.client_ip)
+            request_id = self.response_request_id or self.current_request_id
+            if connection and request_id:
+                for request in connection['time_tracking_queue']:
+                    if request['request_id'] == request_id:
+                        request['bot_audio_duration'] = request.get('bot_audio_duration', 0) + duration
+                        break
+        except Exception:
+            pass
+
     async def _handle_message(self, message, play_queue):
         """Внутренний обработчик сообщений"""
         logger.info(f"[MY_LOG] AOAIAgent_h_m: {message.type}")
+        self.context.on_event(message)
 
         if message.type == "response.audio.delta":
+            if message.response_id == self.interrupted_response_id:
+                return  # Дельта уже отмененного ответа, пришедшая после перебивания
             self._generating = True
+            if self.turn_started_at is not None:
+                metrics.observe(f'turn_first_audio_seconds_{self.input_mode}',
+                                time.perf_counter() - self.turn_started_at)
+                self.turn_started_at = None
+            if message.item_id != self.audio_item_id:
+                # Новая реплика ассистента: курсор воспроизведения с нуля
+                self.audio_item_id = message.item_id
+                self.audio_item_duration = 0.0
+                playback = self._playback()
+                if playback:
+                    playback.start_response()
             audio = base64.b64decode(message.delta)
-            (response_audio, duration) = await process_audio(audio)
-            await play_queue.put((response_audio, duration))
-            # Копим длительность синтезированного ответа для текущего запроса
-            try:
+            self.audio_item_duration += len(audio) / (REALTIME_SAMPLE_RATE * 2)
+            packets = self.audio_framer.push(audio)
+            await self._queue_audio(packets, play_queue)
+
+        elif message.type == "input_audio_buffer.speech_started":
+            # Начало реплики по серверному детектору: новый запрос для учета времени, сброс воспроизведения
+            from .connection_handlers import start_request_tracking
+            connection = self.handler.connections.get(self.client_ip)
+            if connection:
+                self.current_request_id = start_request_tracking(connection)
+                connection['server_vad_audio_start_ms'] = message.audio_start_ms
+                await self.interrupt()
+                await self.handler.send_text(self.client_ip, "Voice detected. Clearing playback queue.")
+                await self.handler.clear_queues(self.client_ip)
+
+        elif message.type == "input_audio_buffer.speech_stopped":
+            # Длительность голоса - по аудио-времени буфера, а не по времени прихода событий
+            connection = self.handler.connections.get(self.client_ip)
+            if connection and self.current_request_id:
+                for request in connection['time_tracking_queue']:
+                    if request['request_id'] == self.current_request_id:
+                        start_ms = connection.get('server_vad_audio_start_ms') or 0
+                        request['voice_duration'] = max(0, message.audio_end_ms - start_ms) / 1000
+                        request['processing_start_time'] = time.time()
+                        break
+            self.mark_turn_start()
+
+        elif message.type == "conversation.item.input_audio_transcription.completed":
+            # Текст реплики в аудио-режиме: в историю, клиенту и в лог токенов (если модель их считает)
+            transcript = (message.transcript or '').strip()
+            await self.handler.add_user_message(self.client_ip, transcript)
+            await self.handler.send_text(self.client_ip, f'<b>Запрос пользователя:</b> {transcript}')
+            usage = getattr(message, 'usage', None)
+            if usage and getattr(usage, 'input_tokens', None) is not None:
                 connection = self.handler.connections.get(self.client_ip)
-                if connection and hasattr(self, 'current_request_id') and self.current_request_id:
-                    for request in connection['time_tracking_queue']:
-                        if request['request_id'] == self.current_request_id:
-                            request['bot_audio_duration'] = request.get('bot_audio_duration', 0) + (duration or 0)
-                            break
-            except Exception:
-                pass
+                user_id = connection.get('user_id', self.client_ip) if connection else self.client_ip
+                user_name = connection.get('user_name', 'Unknown') if connection else 'Unknown'
+                input_tokens = getattr(usage, 'input_tokens', 0) or 0
+                output_tokens = getattr(usage, 'output_tokens', 0) or 0
+                token_logger.log_tokens(user_id, user_name, input_tokens, output_tokens,
+                                        getattr(usage, 'total_tokens', input_tokens + output_tokens))
+
+        elif message.type == "conversation.item.input_audio_transcription.failed":
+            logger.error(f"[MY_LOG] AOAIAgent_h_m: transcription failed | {message}")
+
+        elif message.type == "response.audio.done":
+            # Хвост ответа короче пакета
+            await self._queue_audio(self.audio_framer.flush(), play_queue)
 
         elif message.type == "response.audio_transcript.done":
             # await self.handler.add_assistant_message(self.client_ip, message.transcript)
@@ -131,17 +323,37 @@ class AsyncOpenAIAgent:
                                          )
 
         elif message.type == 'response.created':
+            self.response_id = message.response.id
+            if self._cancel_pending:
+                # Пользователь перебил ответ до его создания: отменяем, дельты не проигрываются
+                self._cancel_pending = False
+                self.interrupted_response_id = self.response_id
+                try:
+                    await self.connection.response.cancel(response_id=self.response_id)
+                except Exception as e:
+                    logger.error(f"[MY_LOG] AOAIAgent_interrupt: {e}")
+                return
             self._generating = True
+            self.response_request_id = self.current_request_id
             # Фиксируем начало ответа для конкретного запроса
             connection = self.handler.connections.get(self.client_ip)
             if connection and hasattr(self, 'current_request_id') and self.current_request_id:
                 for request in connection['time_tracking_queue']:
                     if request['request_id'] == self.current_request_id:
                         request['response_start_time'] = time.time()
+                        # В режиме server_vad обработка - от конца реплики до старта ответа
+                        if self.input_mode == INPUT_MODE_SERVER_VAD and request['processing_start_time']:
+                            request['processing_duration'] = request['response_start_time'] - request['processing_start_time']
                         break
             logger.info(f"[MY_LOG] AOAIAgent_h_m: {message}")
         elif message.type == 'response.done':
+            if self.response_id == getattr(message.response, 'id', None):
+                self.response_id = None
             self._generating = False
+            self.audio_framer.reset()
+            # Ответ относится к запросу, для которого он создан (новая реплика могла начаться раньше)
+            request_id = self.response_request_id or self.current_request_id
+            self.response_request_id = None
             
             # Логируем использованные токены
             try:
@@ -161,9 +373,9 @@ class AsyncOpenAIAgent:
                         # Длительности для отчета
                         incoming_seconds = 0
                         outgoing_seconds = 0
-                        if connection and hasattr(self, 'current_request_id') and self.current_request_id:
+                        if connection and request_id:
                             for request in connection['time_tracking_queue']:
-                                if request['request_id'] == self.current_request_id:
+                                if request['request_id'] == request_id:
                                     incoming_seconds = request.get('voice_duration', 0) or 0
                                     outgoing_seconds = request.get('bot_audio_duration', 0) or 0
                                     break
@@ -174,40 +386,27 @@ class AsyncOpenAIAgent:
                         )
             except Exception as e:
                 logger.error(f"Ошибка логирования токенов: {e}")
+
+            # Контекст сверх бюджета: старые реплики удаляются или сворачиваются в сводку (в фоне)
+            if self.context.on_response_done(getattr(message, 'response', None)):
+                self.context.schedule_prune(self.connection)
             
             # Фиксируем конец ответа и считаем длительность для конкретного запроса
             connection = self.handler.connections.get(self.client_ip)
-            if connection and hasattr(self, 'current_request_id') and self.current_request_id:
+            if connection and request_id:
                 for request in connection['time_tracking_queue']:
-                    if request['request_id'] == self.current_request_id:
+                    if request['request_id'] == request_id:
                         if request['response_start_time']:
                             request['response_duration'] = time.time() - request['response_start_time']
                         # Вызываем подсчет и вычет времени для конкретного запроса
                         from .connection_handlers import calculate_and_deduct_time_for_request
-                        await calculate_and_deduct_time_for_request(self.handler, self.client_ip, self.current_request_id)
+                        await calculate_and_deduct_time_for_request(self.handler, self.client_ip, request_id)
                         break
             logger.info(f"[MY_LOG] AOAIAgent_h_m: {message.type}")
         elif message.type == "error":
             logger.error(f"[MY_LOG] AOAIAgent_h_m: {message}")
 
 
-async def process_audio(response_audio):
-    """Обрабатывает аудиобайты, выполняет ресемплинг при необходимости."""
-    buffer = io.BytesIO()
-    with wave.open(buffer, 'wb') as wf:
-        wf.setnchannels(1)
-        wf.setsampwidth(2)
-
-        num_samples = len(response_audio[200:]) // 2
-        wf.setframerate(24000)
-        duration = num_samples / 24000
-
-        wf.writeframes(response_audio[200:])
-
-    buffer.seek(0)
-    return buffer.read(), duration
-
-
 async def cancel_and_start_llm_generation(connection_manager, client_ip, query):
     await connection_manager.cancel_llm_task(client_ip)
     task = asyncio.create_task(start_llm_generation(connection_manager, client_ip, query))
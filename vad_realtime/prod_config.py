@@ -15,6 +15,70 @@ WS_ENDPOINT = os.getenv("VAD_WS_ENDPOINT", "ws://127.0.0.1:8023/ws")
 OPENAI_ASSISTANT = os.getenv("OPENAI_ASSISTANT")
 ELEVENLABS_VOICE_ID = os.getenv("ELEVENLABS_VOICE_ID")
 
+# Как реплика попадает в realtime модель: whisper (транскрибация, затем текст),
+# audio (PCM прямо во входной аудио-буфер сессии, транскрипт делает сама сессия) или
+# server_vad (аудио идет в сессию непрерывно, конец реплики определяет провайдер, локальный VAD не работает)
+VAD_INPUT_MODE = os.getenv("VAD_INPUT_MODE", "whisper").lower()
+REALTIME_TRANSCRIPTION_MODEL = os.getenv("REALTIME_TRANSCRIPTION_MODEL", "whisper-1")
+
+# Серверный детектор речи (режим server_vad): порог, пауза конца реплики (мс), запас перед речью (мс)
+SERVER_VAD_THRESHOLD = float(os.getenv("SERVER_VAD_THRESHOLD", "0.5"))
+SERVER_VAD_SILENCE_MS = int(os.getenv("SERVER_VAD_SILENCE_MS", "500"))
+SERVER_VAD_PREFIX_PADDING_MS = int(os.getenv("SERVER_VAD_PREFIX_PADDING_MS", "300"))
+
+# Бэкенд Silero VAD (torch | onnx) и число intra-op потоков ONNX Runtime
+VAD_BACKEND = os.getenv("VAD_BACKEND", "torch").lower()
+VAD_ONNX_THREADS = int(os.getenv("VAD_ONNX_THREADS", "1"))
+
+# Адаптивный пул VAD моделей: начальный размер, границы (по умолчанию от числа CPU),
+# среднее ожидание модели для роста пула (мс) и период простоя для уменьшения (с)
+_CPU_COUNT = os.cpu_count() or 1
+VAD_POOL_MIN = int(os.getenv("VAD_POOL_MIN", "1"))
+VAD_POOL_MAX = int(os.getenv("VAD_POOL_MAX", str(_CPU_COUNT)))
+VAD_POOL_SIZE = int(os.getenv("VAD_POOL_SIZE", str(min(4, _CPU_COUNT))))
+VAD_POOL_GROW_WAIT_MS = float(os.getenv("VAD_POOL_GROW_WAIT_MS", "5"))
+VAD_POOL_SHRINK_IDLE_S = float(os.getenv("VAD_POOL_SHRINK_IDLE_S", "60"))
+
+# Батчевый VAD: сколько ждать кадры от других сессий и максимальный размер батча
+VAD_BATCH_TICK_MS = float(os.getenv("VAD_BATCH_TICK_MS", "5"))
+VAD_MAX_BATCH = int(os.getenv("VAD_MAX_BATCH", "64"))
+
+# Потоковый VAD: порог речи, минимальная пауза для конца речи и запас вокруг границ
+VAD_THRESHOLD = float(os.getenv("VAD_THRESHOLD", "0.6"))
+VAD_MIN_SILENCE_MS = int(os.getenv("VAD_MIN_SILENCE_MS", "100"))
+VAD_SPEECH_PAD_MS = int(os.getenv("VAD_SPEECH_PAD_MS", "30"))
+
+# Адаптивный конец реплики: таймаут паузы после законченной фразы / после запинки,
+# границы таймаута (мс) и порог затухания энергии к концу фразы.
+# При ENDPOINT_ADAPTIVE=false всегда ждем ENDPOINT_MAX_MS (прежние 2.5 с)
+ENDPOINT_ADAPTIVE = os.getenv("ENDPOINT_ADAPTIVE", "true").lower() == "true"
+ENDPOINT_MIN_MS = float(os.getenv("ENDPOINT_MIN_MS", "400"))
+ENDPOINT_COMPLETE_MS = float(os.getenv("ENDPOINT_COMPLETE_MS", "700"))
+ENDPOINT_HESITATION_MS = float(os.getenv("ENDPOINT_HESITATION_MS", "1500"))
+ENDPOINT_MAX_MS = float(os.getenv("ENDPOINT_MAX_MS", "2500"))
+ENDPOINT_FALL_RATIO = float(os.getenv("ENDPOINT_FALL_RATIO", "0.6"))
+
+# Спекулятивная транскрибация: после такой паузы (мс) начинаем распознавать реплику,
+# не дожидаясь конца; если речь продолжится - запрос отменяется
+SPECULATIVE_ASR_ENABLED = os.getenv("SPECULATIVE_ASR_ENABLED", "true").lower() == "true"
+SPECULATIVE_ASR_AFTER_MS = float(os.getenv("SPECULATIVE_ASR_AFTER_MS", "300"))
+
+# Обрезка тишины до и после речи (по границам VAD) перед отправкой в ASR и запас вокруг речи (мс)
+UPLOAD_TRIM_SILENCE = os.getenv("UPLOAD_TRIM_SILENCE", "true").lower() == "true"
+UPLOAD_TRIM_PAD_MS = float(os.getenv("UPLOAD_TRIM_PAD_MS", "200"))
+
+# Энергетический пре-гейт: отсекает заведомую тишину до вызова модели
+VAD_GATE_ENABLED = os.getenv("VAD_GATE_ENABLED", "true").lower() == "true"
+VAD_GATE_RATIO = float(os.getenv("VAD_GATE_RATIO", "2.0"))
+VAD_GATE_MAX_RMS = float(os.getenv("VAD_GATE_MAX_RMS", "0.01"))
+
+# Очередь входящих кадров /ws: лимит кадров, лимит по длительности (мс),
+# сколько аудио склеивать в один вызов VAD (мс) и политика при перегрузке (merge | drop_oldest)
+INGEST_QUEUE_MAX_FRAMES = int(os.getenv("INGEST_QUEUE_MAX_FRAMES", "64"))
+INGEST_QUEUE_MAX_MS = int(os.getenv("INGEST_QUEUE_MAX_MS", "5000"))
+INGEST_COALESCE_MS = int(os.getenv("INGEST_COALESCE_MS", "500"))
+INGEST_OVERLOAD_POLICY = os.getenv("INGEST_OVERLOAD_POLICY", "merge")
+
 # Инструкции для AI ассистента
 INSTRUCTIONS_3 = """
 # Ты - ассистент для обучения иностранным языкам через текстовое общение
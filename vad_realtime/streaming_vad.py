@@ -0,0 +1,102 @@
+"""
+Потоковый VAD одной сессии.
+
+Входящий PCM 16 кГц нарезается ровно на окна Silero (512 сэмплов), остаток
+переносится в следующий чанк, рекуррентное состояние модели сохраняется между вызовами.
+Вместо булева значения на каждый чанк выдаются события начала и конца речи.
+Нарезка на окна и пре-гейт выполняются одной задачей в DSP пуле, как и инференс.
+"""
+import numpy as np
+
+from services.dsp_executor import dsp_executor
+from .vad_scheduler import VADState, WINDOW_SIZE, SAMPLE_RATE
+
+SPEECH_START = 'speech_start'
+SPEECH_END = 'speech_end'
+
+
+class StreamingVAD:
+    """Потоковый детектор речи с сохранением состояния Silero между чанками"""
+
+    def __init__(self, scheduler, threshold: float = 0.6, min_silence_ms: int = 100, speech_pad_ms: int = 30,
+                 gate=None):
+        """
+        :param scheduler: BatchedVADScheduler, через который выполняется инференс
+        :param gate: EnergyGate - пре-гейт заведомой тишины перед моделью (опционально)
+        :param threshold: Порог вероятности речи
+        :param min_silence_ms: Сколько тишины нужно, чтобы считать речь законченной
+        :param speech_pad_ms: Запас вокруг границ речи
+        """
+        self.scheduler = scheduler
+        self.gate = gate
+        self.threshold = threshold
+        self.neg_threshold = max(threshold - 0.15, 0.01)
+        self.min_silence_samples = SAMPLE_RATE * min_silence_ms // 1000
+        self.speech_pad_samples = SAMPLE_RATE * speech_pad_ms // 1000
+
+        self.state = VADState()
+        self.remainder = np.zeros(0, dtype=np.int16)  # Хвост, не поместившийся в целое окно
+        self.current_sample = 0  # Сколько сэмплов прошло через модель
+        self.triggered = False  # Идет ли сейчас речь
+        self.temp_end = 0
+
+    async def process(self, audio: np.ndarray):
+        """
+        Обрабатывает очередной чанк (int16, 16 кГц).
+        Возвращает список событий вида {'type': SPEECH_START | SPEECH_END, 'sample': позиция}.
+        """
+        windows, silent = await dsp_executor.run(self._split, audio)
+        if windows is None:
+            return []
+        if silent:
+            # Заведомая тишина: модель не вызываем, а после паузы начинаем с чистого состояния
+            self.current_sample += len(windows) * WINDOW_SIZE
+            self.state = VADState()
+            return []
+
+        probs = await self.scheduler.submit(windows, self.state)
+        return self._update(probs)
+
+    def _split(self, audio: np.ndarray):
+        """
+        Нарезает чанк на целые окна (хвост - в remainder) и прогоняет их через пре-гейт.
+        Выполняется в DSP пуле; чанки одной сессии обрабатываются по очереди.
+        Возвращает (окна формы (k, 512) или None, заведомая ли это тишина).
+        """
+        if len(self.remainder):
+            audio = np.concatenate((self.remainder, audio))
+
+        n_windows = len(audio) // WINDOW_SIZE
+        self.remainder = audio[n_windows * WINDOW_SIZE:].copy()
+        if not n_windows:
+            return None, False
+
+        windows = audio[:n_windows * WINDOW_SIZE].reshape(n_windows, WINDOW_SIZE)
+        silent = self.gate is not None and self.gate.is_silence(windows, self.triggered)
+        return windows, silent
+
+    def _update(self, probs):
+        """Машина состояний как в VADIterator из silero_vad"""
+        events = []
+        for prob in probs:
+            self.current_sample += WINDOW_SIZE
+
+            if prob >= self.threshold and self.temp_end:
+                self.temp_end = 0
+
+            if prob >= self.threshold and not self.triggered:
+                self.triggered = True
+                start = max(0, self.current_sample - self.speech_pad_samples - WINDOW_SIZE)
+                events.append({'type': SPEECH_START, 'sample': start})
+                continue
+
+            if prob < self.neg_threshold and self.triggered:
+                if not self.temp_end:
+                    self.temp_end = self.current_sample
+                if self.current_sample - self.temp_end < self.min_silence_samples:
+                    continue
+                end = self.temp_end + self.speech_pad_samples - WINDOW_SIZE
+                self.temp_end = 0
+                self.triggered = False
+                events.append({'type': SPEECH_END, 'sample': end})
+        return events
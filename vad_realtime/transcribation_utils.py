@@ -3,9 +3,7 @@ import sys
 import numpy as np
 import io
 import time
-import wave
 import asyncio
-import openai
 import warnings
 import logging
 
@@ -19,14 +17,37 @@ logging.getLogger('torch').setLevel(logging.ERROR)
 _stderr_backup = sys.stderr
 sys.stderr = io.StringIO()
 
-from silero_vad import load_silero_vad, get_speech_timestamps
+from .vad_pool import VADModelPool
 
 # Восстанавливаем stderr
 sys.stderr = _stderr_backup
-from .llm_utils import cancel_and_start_llm_generation
-from .prod_config import OPEN_AI_API_KEY
+from .llm_utils import cancel_and_start_llm_generation, INPUT_MODE_AUDIO, INPUT_MODE_WHISPER
+from .connection_handlers import start_request_tracking
+from .prod_config import (
+    VAD_BACKEND, VAD_ONNX_THREADS, VAD_BATCH_TICK_MS, VAD_MAX_BATCH,
+    VAD_POOL_SIZE, VAD_POOL_MIN, VAD_POOL_MAX, VAD_POOL_GROW_WAIT_MS, VAD_POOL_SHRINK_IDLE_S,
+    VAD_THRESHOLD, VAD_MIN_SILENCE_MS, VAD_SPEECH_PAD_MS,
+    VAD_GATE_ENABLED, VAD_GATE_RATIO, VAD_GATE_MAX_RMS,
+    ENDPOINT_ADAPTIVE, ENDPOINT_MIN_MS, ENDPOINT_COMPLETE_MS, ENDPOINT_HESITATION_MS, ENDPOINT_MAX_MS,
+    ENDPOINT_FALL_RATIO, SPECULATIVE_ASR_ENABLED, SPECULATIVE_ASR_AFTER_MS,
+    UPLOAD_TRIM_SILENCE, UPLOAD_TRIM_PAD_MS,
+)
+from .vad_scheduler import BatchedVADScheduler
+from .streaming_vad import StreamingVAD, SPEECH_START
+from .energy_gate import EnergyGate
+from .endpointer import Endpointer
+from .audio_buffer import BYTES_PER_SECOND
+from services.wav import capture_debug_wav
+from services.upload_audio import prepare_upload, record_upload, UPLOAD_AUDIO_FORMAT
+from services.asr import asr_backend, transcribe_audio
+from services.metrics import metrics
 
-client = openai.AsyncClient(api_key=OPEN_AI_API_KEY)
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s [%(levelname)s] %(message)s',
+    handlers=[logging.StreamHandler(sys.stdout)]
+)
+logger = logging.getLogger("uvicorn")
 
 
 async def process_audio_chunk(connection_manager, client_ip: str, chunk: bytes):
@@ -36,39 +57,60 @@ async def process_audio_chunk(connection_manager, client_ip: str, chunk: bytes):
     connection = connection_manager.connections[client_ip]
     
     # НЕ блокируем при обработке - даем возможность договорить текущее сообщение
-    
-    detected = await detect_voice(chunk)
-    if detected:
-        if not connection['is_recording']:
-            connection['is_recording'] = True
-            # Создаем новый запрос с уникальным ID
-            import uuid
-            request_id = str(uuid.uuid4())
-            connection['current_request_id'] = request_id
-            # Добавляем в очередь отслеживания времени
-            connection['time_tracking_queue'].append({
-                'request_id': request_id,
-                'recording_start_time': time.time(),
-                'voice_duration': 0,
-                'processing_start_time': None,
-                'processing_duration': 0,
-                'response_start_time': None,
-                'response_duration': 0,
-                'bot_audio_duration': 0  # длительность синтезированного ответа (секунды)
-            })
-            connection['audio_buffer'] = io.BytesIO()
-            await connection_manager.send_text(client_ip, "Voice detected. Clearing playback queue.")
-            await connection_manager.clear_queues(client_ip)
-            temp_chunks = await connection_manager.get_temporary_chunks(client_ip)
-            for n in temp_chunks:
-                connection['audio_buffer'].write(n)
-
-        connection['last_voice_time'] = len(connection['audio_buffer'].getvalue())
-        connection['audio_buffer'].write(chunk)
-    elif connection['is_recording']:
-        connection['audio_buffer'].write(chunk)
-        if len(connection['audio_buffer'].getvalue()) - connection['last_voice_time'] > 80000:
-            # Голос не обнаружен в течение 3 секунд, сохраняем файл
+
+    vad = connection.get('vad')
+    if vad is None:
+        # Пул может быть не загружен на старте, если по умолчанию включен server_vad (загрузка - в DSP пуле)
+        await initialize_vad()
+        gate = EnergyGate(ratio=VAD_GATE_RATIO, max_rms=VAD_GATE_MAX_RMS) if VAD_GATE_ENABLED else None
+        vad = StreamingVAD(vad_scheduler, threshold=VAD_THRESHOLD,
+                           min_silence_ms=VAD_MIN_SILENCE_MS, speech_pad_ms=VAD_SPEECH_PAD_MS, gate=gate)
+        connection['vad'] = vad
+        connection['endpointer'] = Endpointer(
+            min_ms=ENDPOINT_MIN_MS, complete_ms=ENDPOINT_COMPLETE_MS, hesitation_ms=ENDPOINT_HESITATION_MS,
+            max_ms=ENDPOINT_MAX_MS, fall_ratio=ENDPOINT_FALL_RATIO,
+            guard_ms=VAD_MIN_SILENCE_MS + VAD_SPEECH_PAD_MS, adaptive=ENDPOINT_ADAPTIVE,
+        )
+    endpointer = connection['endpointer']
+
+    events = await detect_voice(vad, chunk)
+    speech_started = any(event['type'] == SPEECH_START for event in events)
+    if speech_started and not connection['is_recording']:
+        connection['is_recording'] = True
+        # Создаем новый запрос с уникальным ID в очереди отслеживания времени
+        start_request_tracking(connection)
+        endpointer.on_turn_start()
+        # Перебивание: отмена ответа и обрезка его по уже проигранному, до сброса очередей
+        agent = connection.get('agent')
+        if agent:
+            await agent.interrupt()
+        await connection_manager.send_text(client_ip, "Voice detected. Clearing playback queue.")
+        await connection_manager.clear_queues(client_ip)
+        temp_chunks = await connection_manager.get_temporary_chunks(client_ip)
+        connection['audio_buffer'].start(temp_chunks)
+
+    if connection['is_recording']:
+        audio_buffer = connection['audio_buffer']
+        voiced = vad.triggered or events
+        if voiced:
+            # Пауза внутри реплики закончилась - учитываем ее в статистике пауз сессии
+            endpointer.on_voice(audio_buffer.silence_length)
+            # Спекулятивная транскрибация устарела: пользователь продолжил говорить
+            cancel_speculative_transcription(connection)
+        audio_buffer.write(chunk)
+        # Границы речи по событиям VAD - для обрезки тишины перед отправкой
+        audio_buffer.align(vad.current_sample + len(vad.remainder))
+        for event in events:
+            if event['type'] == SPEECH_START:
+                audio_buffer.mark_speech(start=event['sample'])
+            else:
+                audio_buffer.mark_speech(end=event['sample'])
+        if voiced:
+            # Речь идет или в этом чанке была граница речи - тишина отсчитывается после чанка
+            audio_buffer.mark_voice()
+        if not vad.triggered and endpointer.should_end(audio_buffer):
+            # Пауза достигла адаптивного таймаута - реплика закончена
+            endpointer.on_endpoint()
             # Находим текущий запрос в очереди и обновляем его
             current_request_id = connection.get('current_request_id')
             if current_request_id:
@@ -83,86 +125,117 @@ async def process_audio_chunk(connection_manager, client_ip: str, chunk: bytes):
             await connection_manager.send_text(client_ip, "Запрос обрабатывается...")
             await save_and_process_audio(connection_manager, client_ip)
             connection['is_recording'] = False
-            connection['audio_buffer'] = io.BytesIO()
+        elif (SPECULATIVE_ASR_ENABLED and not vad.triggered and connection['speculative_asr'] is None
+              and audio_buffer.silence_length >= SPECULATIVE_ASR_AFTER_MS * BYTES_PER_SECOND / 1000
+              and getattr(connection.get('agent'), 'input_mode', None) == INPUT_MODE_WHISPER):
+            # Короткая пауза: начинаем распознавать сказанное, пока ждем конец реплики
+            start_speculative_transcription(connection)
 
     await connection_manager.record_temporary_chunk(client_ip, chunk)
 
 
-class VADModelPool:
+def start_speculative_transcription(connection):
+    """Запускает распознавание записанного на текущий момент в фоне"""
+    # Срез view остается валидным: буфер только дописывается, а при росте переезжает в новое хранилище
+    audio_buffer = connection['audio_buffer']
+    start, end = utterance_range(audio_buffer)
+    audio_data = audio_buffer.view()[start:end]
+    uploads = []
+    connection['speculative_asr'] = {
+        'task': asyncio.create_task(transcribe_utterance(audio_data, uploads)),
+        'uploads': uploads,
+        'length': len(audio_data),
+        'started_at': time.perf_counter(),
+    }
+    metrics.inc('asr_speculative_started_total')
+
+
+def utterance_range(audio_buffer):
+    """Диапазон высказывания для отправки: без тишины до и после речи (если включено)"""
+    if not UPLOAD_TRIM_SILENCE:
+        return 0, len(audio_buffer)
+    return audio_buffer.speech_range(int(UPLOAD_TRIM_PAD_MS * BYTES_PER_SECOND / 1000) & ~1)
+
+
+async def transcribe_utterance(audio_data, uploads: list = None):
     """
-    Пул VAD моделей для нагрузоустойчивости сервиса
+    Упаковывает высказывание (WAV или сжатый формат) и распознает его.
+    uploads получает упакованные файлы (по одному на запрос) - для метрик размера отправки.
     """
-    def __init__(self, pool_size: int = 4):
-        self.pool_size = pool_size
-        self.models_queue = asyncio.Queue()
-        self.lock = asyncio.Lock()
-        self._initialized = False
-
-    async def initialize(self):
-        """Публичный метод инициализации"""
-        if not self._initialized:
-            async with self.lock:
-                if not self._initialized:
-                    for _ in range(self.pool_size):
-                        model = load_silero_vad()
-                        await self.models_queue.put(model)
-                    self._initialized = True
-
-    async def acquire_model(self):
-        """
-        Возвращает свободную модель VAD для использования
-        """
-        if not self._initialized:
-            raise RuntimeError("VAD pool not initialized")
-        return await self.models_queue.get()
-
-    async def release_model(self, model):
-        """
-        Отпускает и возвращает в пул свободную модель VAD
-        """
-        await self.models_queue.put(model)
-
-vad_pool = VADModelPool(pool_size=4)
+    # Локальному движку сжатие не нужно: сети нет, а PCM он принимает без декодирования
+    fmt = 'wav' if asr_backend.name == 'local' else UPLOAD_AUDIO_FORMAT
 
-async def initialize_vad():
-    """Публичная функция для инициализации VAD пула"""
-    await vad_pool.initialize()
-async def detect_voice(frame):
+    async def make_upload():
+        # Для каждого запроса (основного и хеджа) - свой поток чтения
+        upload = await prepare_upload(audio_data, 16000, fmt)
+        if uploads is not None:
+            uploads.append(upload)
+        return upload
+
+    return await transcribe_audio(make_upload)
+
+
+def cancel_speculative_transcription(connection):
+    """Отменяет спекулятивное распознавание, если оно идет (запрос потрачен впустую)"""
+    speculative = connection.get('speculative_asr')
+    if speculative is not None:
+        speculative['task'].cancel()
+        connection['speculative_asr'] = None
+        metrics.inc('asr_speculative_wasted_total')
+
+
+async def take_speculative_transcription(connection, uploads: list):
     """
-    Определяет наличие голоса в чанке аудио
+    Забирает результат спекулятивного распознавания для закончившейся реплики.
+    None - спекуляции не было или она завершилась ошибкой, нужно распознавать заново.
+    При успехе упакованные файлы спекуляции добавляются в uploads.
     """
+    speculative = connection.get('speculative_asr')
+    if speculative is None:
+        return None
+    connection['speculative_asr'] = None
+    head_start = time.perf_counter() - speculative['started_at']
     try:
-        vad_model = await vad_pool.acquire_model()
-        
-        # Проверяем, что размер буфера кратен 2 (размер int16)
-        if len(frame) % 2 != 0:
-            # Обрезаем последний байт, если размер нечетный
-            frame = frame[:-1]
-        
-        # Если буфер пустой или слишком маленький, возвращаем False
-        if len(frame) < 2:
-            return False
-            
-        audio_int16 = np.frombuffer(frame, np.int16)
-        audio_float32 = int2float(audio_int16)
-        speech_timestamps = get_speech_timestamps(audio_float32, vad_model, threshold=0.6)
-        if speech_timestamps:
-            return True
-        return False
-    finally:
-        await vad_pool.release_model(vad_model)
+        text = await speculative['task']
+    except (Exception, asyncio.CancelledError) as e:
+        if not isinstance(e, asyncio.CancelledError):
+            logger.warning(f"[ASR] Спекулятивное распознавание не удалось | error={e}")
+        metrics.inc('asr_speculative_failed_total')
+        return None
+    uploads.extend(speculative['uploads'])
+    metrics.inc('asr_speculative_useful_total')
+    # Сколько распознавания уже было сделано к моменту конца реплики
+    metrics.observe('asr_speculative_head_start_seconds', head_start)
+    return text
+
 
+vad_pool = VADModelPool(pool_size=VAD_POOL_SIZE, min_size=VAD_POOL_MIN, max_size=VAD_POOL_MAX,
+                        backend=VAD_BACKEND, onnx_threads=VAD_ONNX_THREADS,
+                        grow_wait_ms=VAD_POOL_GROW_WAIT_MS, shrink_idle_s=VAD_POOL_SHRINK_IDLE_S)
+vad_scheduler = BatchedVADScheduler(vad_pool, tick_ms=VAD_BATCH_TICK_MS, max_batch=VAD_MAX_BATCH)
 
-def int2float(sound):
+async def initialize_vad():
+    """Публичная функция для инициализации VAD пула"""
+    await vad_pool.initialize()
+    vad_scheduler.start()
+async def detect_voice(vad, frame):
     """
-    Конвертирует
+    Прогоняет чанк аудио через потоковый VAD сессии.
+    Возвращает события начала/конца речи.
     """
-    abs_max = np.abs(sound).max()
-    sound = sound.astype('float32')
-    if abs_max > 0:
-        sound *= 1 / 32768
-    sound = sound.squeeze()
-    return sound
+    # Проверяем, что размер буфера кратен 2 (размер int16)
+    if len(frame) % 2 != 0:
+        # Обрезаем последний байт, если размер нечетный
+        frame = frame[:-1]
+
+    # Если буфер пустой или слишком маленький, событий нет
+    if len(frame) < 2:
+        return []
+
+    audio_int16 = np.frombuffer(frame, np.int16)
+    # Нарезка, пре-гейт, конвертация и инференс (общий батч со всеми сессиями) - в DSP пуле
+    return await vad.process(audio_int16)
+
 
 async def save_and_process_audio(connection_manager, client_ip: str):
     """Сохраняет и обрабатывает аудиофайл"""
@@ -173,6 +246,10 @@ async def save_and_process_audio(connection_manager, client_ip: str):
     if user_id:
         remaining_seconds = await db_handler.get_remaining_seconds(user_id)
         if remaining_seconds <= 0:
+            connection = connection_manager.connections.get(client_ip)
+            if connection:
+                # Ответ не нужен: спекулятивное распознавание паузы отменяется сразу
+                cancel_speculative_transcription(connection)
             await connection_manager.send_text(
                 client_ip, 
                 "У вас закончились минуты. Пожалуйста, пополните баланс для продолжения."
@@ -182,19 +259,35 @@ async def save_and_process_audio(connection_manager, client_ip: str):
             return
     
     connection = connection_manager.connections[client_ip]
-    audio_data = connection['audio_buffer'].getvalue()
+    # memoryview на готовое высказывание без тишины по краям, буфер сразу готов к следующей записи
+    original_bytes = len(connection['audio_buffer'])
+    start, end = utterance_range(connection['audio_buffer'])
+    audio_data = connection['audio_buffer'].detach()[start:end]
     connection['is_recording'] = False
-    connection['audio_buffer'] = io.BytesIO()
-
-    filename = f"temp/{str(round(time.time()))}.wav"
-    with wave.open(filename, 'wb') as wf:
-        wf.setnchannels(1)
-        wf.setsampwidth(2)
-        wf.setframerate(16000)
-        wf.writeframes(audio_data)
+
+    # WAV собирается в памяти: заголовок + memoryview на PCM, на диск только в режиме отладки
+    await capture_debug_wav(audio_data, 16000, tag='vad')
+    agent = await connection_manager.get_property(client_ip, 'agent')
+    if agent:
+        agent.mark_turn_start()
+
+    if agent and agent.input_mode == INPUT_MODE_AUDIO:
+        cancel_speculative_transcription(connection)
+        # Аудио сразу во входной буфер realtime сессии, транскрипт придет событием от сессии
+        await connection_manager.send_text(client_ip, 'Генерируется ответ')
+        current_request_id = _mark_processing_done(connection)
+        await agent.send_audio(audio_data, request_id=current_request_id)
+        return
+
     start_time = time.time()
-    with open(filename, 'rb') as f:
-        transcribed_text = await audio_to_text(f)
+    # После спекулятивного запуска в записи была только тишина - его результат актуален
+    uploads = []
+    transcribed_text = await take_speculative_transcription(connection, uploads)
+    if transcribed_text is None:
+        transcribed_text = await transcribe_utterance(audio_data, uploads)
+    if uploads:
+        # Байты считаются один раз на реплику - по первому запросу
+        record_upload(uploads[0], original_bytes)
 
     # transcribed_text = await transcribate_file_rt(filename, False)
 
@@ -207,33 +300,18 @@ async def save_and_process_audio(connection_manager, client_ip: str):
     if transcribed_text and not transcribed_text.isspace():
         await connection_manager.send_text(client_ip, 'Генерируется ответ')
         
-        # Фиксируем время обработки для текущего запроса
-        connection = connection_manager.connections[client_ip]
-        current_request_id = connection.get('current_request_id')
-        if current_request_id:
-            for request in connection['time_tracking_queue']:
-                if request['request_id'] == current_request_id:
-                    if request['processing_start_time']:
-                        request['processing_duration'] = time.time() - request['processing_start_time']
-                    break
-        
-        agent = await connection_manager.get_property(client_ip, 'agent')
+        current_request_id = _mark_processing_done(connection_manager.connections[client_ip])
         # Передаем request_id в agent для отслеживания
         await agent.send_text(transcribed_text, request_id=current_request_id)
 
 
-async def audio_to_text(audio_stream):
-    # audio = AudioSegment.from_file(io.BytesIO(audio_bytes))
-    # buffer = io.BytesIO()
-    # audio.export(buffer, format="wav", codec="pcm_s16le", parameters=["-ar", "16000", "-ac", "1"])
-    # buffer.name = "audio.wav"
-    # buffer.seek(0)
-
-    transcript = await client.audio.transcriptions.create(
-        model="whisper-1",
-        file=audio_stream,
-    )
-    return transcript.text
-
-
-
+def _mark_processing_done(connection):
+    """Фиксирует время обработки для текущего запроса, возвращает его request_id"""
+    current_request_id = connection.get('current_request_id')
+    if current_request_id:
+        for request in connection['time_tracking_queue']:
+            if request['request_id'] == current_request_id:
+                if request['processing_start_time']:
+                    request['processing_duration'] = time.time() - request['processing_start_time']
+                break
+    return current_request_id
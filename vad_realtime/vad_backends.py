@@ -0,0 +1,78 @@
+"""
+Бэкенды Silero VAD: torch (JIT) или ONNX Runtime.
+
+ONNX вариант поставляется вместе с пакетом silero_vad. Все экземпляры пула используют
+одну общую InferenceSession (веса в памяти один раз), у каждого экземпляра свое
+рекуррентное состояние. Интерфейс одинаковый: model(x, sr), reset_states, _state/_context.
+"""
+import copy
+import logging
+import sys
+
+import torch
+from silero_vad import load_silero_vad
+from silero_vad.utils_vad import OnnxWrapper
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s [%(levelname)s] %(message)s',
+    handlers=[logging.StreamHandler(sys.stdout)]
+)
+logger = logging.getLogger("uvicorn")
+
+BACKEND_TORCH = 'torch'
+BACKEND_ONNX = 'onnx'
+BACKENDS = (BACKEND_TORCH, BACKEND_ONNX)
+SMOKE_WINDOW = 512  # Одно окно 16 кГц для проверки модели после загрузки
+
+
+def _onnx_model_path() -> str:
+    """Путь к silero_vad.onnx внутри установленного пакета"""
+    from importlib.resources import files
+    return str(files('silero_vad.data') / 'silero_vad.onnx')
+
+
+def create_onnx_session(intra_op_threads: int = 1):
+    """Создает InferenceSession с заданным числом intra-op потоков"""
+    import onnxruntime
+
+    opts = onnxruntime.SessionOptions()
+    opts.inter_op_num_threads = 1
+    opts.intra_op_num_threads = intra_op_threads
+    return onnxruntime.InferenceSession(
+        _onnx_model_path(), providers=['CPUExecutionProvider'], sess_options=opts
+    )
+
+
+def smoke_test(model):
+    """Прогон одного окна тишины: падает сразу при загрузке, а не на первом чанке пользователя"""
+    model(torch.zeros(SMOKE_WINDOW), 16000)
+    model.reset_states()
+
+
+def load_vad_models(backend: str, count: int, onnx_threads: int = 1, session=None) -> list:
+    """
+    Загружает count экземпляров модели выбранного бэкенда.
+
+    Для ONNX загружается одна обертка, остальные - ее копии с общей сессией.
+    session позволяет переиспользовать уже созданную InferenceSession (например при росте пула).
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown VAD backend: {backend}")
+
+    logger.info(f"[VAD] Загрузка моделей | backend={backend} | count={count}")
+    if backend == BACKEND_TORCH:
+        models = [load_silero_vad() for _ in range(count)]
+        smoke_test(models[0])
+        return models
+
+    # Обертка через публичный конструктор, затем сессия заменяется общей с нужным числом потоков
+    base = OnnxWrapper(_onnx_model_path(), force_onnx_cpu=True)
+    base.session = session or create_onnx_session(onnx_threads)
+    smoke_test(base)
+    models = [base]
+    for _ in range(count - 1):
+        model = copy.copy(base)  # Общая session, состояние у каждой копии свое
+        model.reset_states()
+        models.append(model)
+    return models
@@ -0,0 +1,157 @@
+"""
+Адаптивный пул экземпляров Silero VAD.
+
+Размер пула меняется в пределах [min_size, max_size] по наблюдаемому ожиданию модели:
+если батчи ждут свободную модель дольше grow_wait - пул растет на один экземпляр,
+если за период простоя ни разу не были заняты все модели - пул уменьшается на один.
+Ожидание, занятость и число моделей в работе пишутся в метрики.
+"""
+import asyncio
+import time
+import logging
+import sys
+
+from services.metrics import metrics
+from services.dsp_executor import dsp_executor
+from .vad_backends import load_vad_models, BACKEND_ONNX
+from .vad_scheduler import check_batched_inference
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s [%(levelname)s] %(message)s',
+    handlers=[logging.StreamHandler(sys.stdout)]
+)
+logger = logging.getLogger("uvicorn")
+
+ACQUIRE_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+WAIT_EWMA_ALPHA = 0.2
+
+
+class VADModelPool:
+    """
+    Пул VAD моделей для нагрузоустойчивости сервиса
+    """
+    def __init__(self, pool_size: int = 4, min_size: int = 1, max_size: int = 4, backend: str = 'torch',
+                 onnx_threads: int = 1, grow_wait_ms: float = 5, shrink_idle_s: float = 60):
+        """
+        :param pool_size: Начальный размер пула
+        :param min_size: Минимальный размер пула
+        :param max_size: Максимальный размер пула
+        :param grow_wait_ms: Среднее ожидание модели (мс), при превышении которого пул растет
+        :param shrink_idle_s: Период, после которого недогруженный пул уменьшается
+        """
+        self.min_size = max(1, min_size)
+        self.max_size = max(self.min_size, max_size)
+        self.pool_size = min(max(pool_size, self.min_size), self.max_size)
+        self.backend = backend
+        self.onnx_threads = onnx_threads
+        self.grow_wait = grow_wait_ms / 1000
+        self.shrink_idle = shrink_idle_s
+        self.models_queue = asyncio.Queue()
+        self.lock = asyncio.Lock()
+        self._initialized = False
+        self._session = None  # Общая InferenceSession для ONNX, переиспользуется при росте
+        self._growing = False
+        self._retire = 0  # Сколько моделей изъять из пула при возврате
+        self.in_flight = 0
+        self._peak_in_flight = 0
+        self._wait_ewma = 0.0
+        self._last_resize = 0.0
+
+    async def initialize(self):
+        """Публичный метод инициализации; загрузка моделей - в DSP пуле, event loop не блокируется"""
+        if not self._initialized:
+            async with self.lock:
+                if not self._initialized:
+                    models = await dsp_executor.run(load_vad_models, self.backend, self.pool_size, self.onnx_threads)
+                    # Батч из двух сессий должен совпасть с отдельными прогонами - иначе не стартуем
+                    await dsp_executor.run(check_batched_inference, models[0])
+                    for model in models:
+                        await self.models_queue.put(model)
+                        if self.backend == BACKEND_ONNX:
+                            self._session = model.session
+                    self._last_resize = time.monotonic()
+                    self._initialized = True
+                    self._publish()
+                    logger.info(f"[VAD POOL] Пул готов | size={self.pool_size} | "
+                                f"min={self.min_size} | max={self.max_size}")
+
+    async def acquire_model(self):
+        """
+        Возвращает свободную модель VAD для использования
+        """
+        if not self._initialized:
+            raise RuntimeError("VAD pool not initialized")
+        started = time.perf_counter()
+        model = await self.models_queue.get()
+        waited = time.perf_counter() - started
+
+        self.in_flight += 1
+        self._peak_in_flight = max(self._peak_in_flight, self.in_flight)
+        self._wait_ewma += WAIT_EWMA_ALPHA * (waited - self._wait_ewma)
+        metrics.observe('vad_pool_acquire_seconds', waited, buckets=ACQUIRE_BUCKETS)
+        self._publish()
+        self._maybe_resize()
+        return model
+
+    async def release_model(self, model):
+        """
+        Отпускает и возвращает в пул свободную модель VAD
+        """
+        self.in_flight -= 1
+        if self._retire > 0:
+            # Модель выводится из пула при уменьшении
+            self._retire -= 1
+        else:
+            await self.models_queue.put(model)
+        self._publish()
+
+    def _maybe_resize(self):
+        """Решает, нужно ли вырасти или сжаться, по среднему ожиданию и пиковой занятости"""
+        now = time.monotonic()
+        if self._wait_ewma > self.grow_wait and self.pool_size < self.max_size and not self._growing:
+            self._growing = True
+            asyncio.create_task(self._grow())
+            return
+
+        if now - self._last_resize < self.shrink_idle:
+            return
+        # За весь период хотя бы одна модель простаивала - одну можно убрать
+        if self._peak_in_flight < self.pool_size and self.pool_size > self.min_size:
+            self.pool_size -= 1
+            try:
+                self.models_queue.get_nowait()
+            except asyncio.QueueEmpty:
+                self._retire += 1
+            metrics.inc('vad_pool_shrink_total')
+            logger.info(f"[VAD POOL] Уменьшение пула | size={self.pool_size} | "
+                        f"peak_in_flight={self._peak_in_flight}")
+        self._last_resize = now
+        self._peak_in_flight = self.in_flight
+
+    async def _grow(self):
+        """Добавляет один экземпляр модели; загрузка - в DSP пуле"""
+        try:
+            models = await dsp_executor.run(
+                load_vad_models, self.backend, 1, self.onnx_threads, self._session
+            )
+            self.pool_size += 1
+            await self.models_queue.put(models[0])
+            metrics.inc('vad_pool_grow_total')
+            logger.info(f"[VAD POOL] Рост пула | size={self.pool_size} | "
+                        f"wait_ewma_ms={self._wait_ewma * 1000:.2f}")
+        except Exception as e:
+            logger.error(f"[VAD POOL] Ошибка загрузки модели | error={e}")
+        finally:
+            # Следующее решение - по новым замерам ожидания
+            self._wait_ewma = 0.0
+            self._last_resize = time.monotonic()
+            self._peak_in_flight = self.in_flight
+            self._growing = False
+            self._publish()
+
+    def _publish(self):
+        metrics.set_gauge('vad_pool_size', self.pool_size)
+        metrics.set_gauge('vad_pool_in_flight', self.in_flight)
+        metrics.set_gauge('vad_pool_utilization', round(self.in_flight / self.pool_size, 4))
+        metrics.set_gauge('vad_pool_wait_ewma_seconds', round(self._wait_ewma, 6))
@@ -0,0 +1,218 @@
+"""
+Планировщик батчевого инференса Silero VAD.
+
+Окна от всех /ws сессий собираются в течение короткого тика и прогоняются
+через модель одним батчем, вместо сотен одиночных вызовов в секунду.
+"""
+import asyncio
+import time
+import logging
+import sys
+
+import numpy as np
+import torch
+
+from services.metrics import metrics
+from services.dsp_executor import dsp_executor
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s [%(levelname)s] %(message)s',
+    handlers=[logging.StreamHandler(sys.stdout)]
+)
+logger = logging.getLogger("uvicorn")
+
+SAMPLE_RATE = 16000
+WINDOW_SIZE = 512  # Размер окна Silero для 16 кГц
+CONTEXT_SIZE = 64  # Контекст, который Silero подклеивает к каждому окну
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+
+def int2float(sound):
+    """
+    Конвертирует int16 в float32 в диапазоне [-1, 1]
+    """
+    abs_max = np.abs(sound).max()
+    sound = sound.astype('float32')
+    if abs_max > 0:
+        sound *= 1 / 32768
+    sound = sound.squeeze()
+    return sound
+
+
+class VADState:
+    """Рекуррентное состояние Silero для одной сессии"""
+    def __init__(self):
+        self.state = torch.zeros((2, 1, 128), dtype=torch.float32)
+        self.context = torch.zeros((1, CONTEXT_SIZE), dtype=torch.float32)
+
+
+def _load_states(model, states):
+    """Склеивает состояния сессий в батч и подставляет их в модель"""
+    model._state = torch.cat([s.state for s in states], dim=1)
+    model._context = torch.cat([s.context for s in states], dim=0)
+    model._last_sr = SAMPLE_RATE
+    model._last_batch_size = len(states)
+
+
+def _store_states(model, states):
+    """Раскладывает состояние модели обратно по сессиям"""
+    for row, s in enumerate(states):
+        s.state = model._state[:, row:row + 1]
+        s.context = model._context[row:row + 1]
+
+
+def infer_batch(model, requests):
+    """
+    Прогоняет окна нескольких сессий через модель одним батчем.
+
+    requests - список (windows, state): windows формы (k, 512) int16 16 кГц,
+    state - VADState сессии, обновляется на месте.
+    Выполняется в DSP пуле, конвертация в float32 тоже происходит здесь.
+    Возвращает список массивов вероятностей речи по окнам для каждого запроса.
+    """
+    counts = [len(windows) for windows, _ in requests]
+    probs = [np.empty(k, dtype=np.float32) for k in counts]
+
+    active = None
+    states = []
+    with torch.no_grad():
+        for i in range(max(counts)):
+            step_active = [row for row, k in enumerate(counts) if k > i]
+            # Батч меняется только когда у какой-то сессии закончились окна
+            if step_active != active:
+                if active is not None:
+                    _store_states(model, states)
+                active = step_active
+                states = [requests[row][1] for row in active]
+                _load_states(model, states)
+
+            window = np.stack([requests[row][0][i] for row in active])
+            window = torch.from_numpy(int2float(window).reshape(len(active), WINDOW_SIZE))
+            out = model(window, SAMPLE_RATE).reshape(-1).numpy()
+            for j, row in enumerate(active):
+                probs[row][i] = out[j]
+        _store_states(model, states)
+
+    return probs
+
+
+def check_batched_inference(model, tolerance: float = 1e-4):
+    """
+    Проверка батчевого прогона на загруженной модели: две сессии разной длины с ненулевым
+    состоянием в одном батче должны дать те же вероятности, что и каждая по отдельности.
+    Если модель молча проигнорирует подмену _state/_context, вероятности разойдутся.
+    """
+    rng = np.random.default_rng(0)
+    t = np.arange(WINDOW_SIZE * 6) / SAMPLE_RATE
+    tone = np.sin(2 * np.pi * 180 * t) * np.sin(2 * np.pi * 3 * t) * 12000 + rng.normal(0, 800, t.size)
+    noise = rng.normal(0, 3000, WINDOW_SIZE * 4)
+    sessions = [np.clip(signal, -32768, 32767).astype(np.int16).reshape(-1, WINDOW_SIZE) for signal in (tone, noise)]
+
+    # Второй проход каждого варианта идет уже с состоянием от первого
+    states = [VADState() for _ in sessions]
+    for _ in range(2):
+        together = infer_batch(model, list(zip(sessions, states)))
+    for row, windows in enumerate(sessions):
+        state = VADState()
+        for _ in range(2):
+            alone = infer_batch(model, [(windows, state)])[0]
+        diff = float(np.abs(alone - together[row]).max())
+        if diff > tolerance:
+            raise RuntimeError(f"Batched VAD inference differs from single-session run: session={row} diff={diff:.6f}")
+    model.reset_states()
+
+
+class BatchedVADScheduler:
+    """
+    Собирает кадры от всех сессий за тик и выполняет один батчевый проход модели
+    """
+    def __init__(self, model_pool, tick_ms: float = 5, max_batch: int = 64):
+        self.model_pool = model_pool
+        self.tick = tick_ms / 1000
+        self.max_batch = max_batch
+        self.pending = []  # ((окна, состояние), future, время постановки в очередь)
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._inflight = set()
+
+    def start(self):
+        """Запускает фоновый цикл планировщика"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for task in list(self._inflight):
+            task.cancel()
+
+    async def submit(self, windows: np.ndarray, state: VADState):
+        """
+        Ставит окна сессии в очередь на инференс и ждет результат.
+        Возвращает массив вероятностей речи по окнам, state сессии обновляется.
+        """
+        if self._task is None:
+            raise RuntimeError("VAD scheduler not started")
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append(((windows, state), future, time.perf_counter()))
+        self._wakeup.set()
+        return await future
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            # Даем другим сессиям время добавить свои кадры в этот же батч
+            await asyncio.sleep(self.tick)
+            self._wakeup.clear()
+
+            batch = self.pending[:self.max_batch]
+            self.pending = self.pending[self.max_batch:]
+            if self.pending:
+                self._wakeup.set()
+
+            # Батчи идут параллельно, одновременность ограничена числом моделей в пуле
+            task = asyncio.create_task(self._process_safe(batch))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _process_safe(self, batch):
+        try:
+            await self._process(batch)
+        except Exception as e:
+            logger.error(f"[VAD BATCH] Ошибка инференса | batch={len(batch)} | error={e}")
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+
+    async def _process(self, batch):
+        # Запросы, чьи сессии уже отключились, в батч не берем
+        batch = [item for item in batch if not item[1].done()]
+        if not batch:
+            return
+
+        started = time.perf_counter()
+        for _, _, enqueued_at in batch:
+            metrics.observe('vad_queue_wait_seconds', started - enqueued_at)
+        metrics.observe('vad_batch_size', len(batch), buckets=BATCH_SIZE_BUCKETS)
+        metrics.inc('vad_batches_total')
+        metrics.inc('vad_frames_total', len(batch))
+        metrics.inc('vad_windows_total', sum(len(request[0]) for request, _, _ in batch))
+
+        model = await self.model_pool.acquire_model()
+        try:
+            # Прогон модели - синхронная работа torch, уводим ее с event loop
+            results = await dsp_executor.run(infer_batch, model, [request for request, _, _ in batch])
+        finally:
+            await self.model_pool.release_model(model)
+        metrics.observe('vad_batch_inference_seconds', time.perf_counter() - started)
+
+        for (_, future, _), probs in zip(batch, results):
+            if not future.done():
+                future.set_result(probs)